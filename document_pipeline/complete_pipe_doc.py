@@ -1,15 +1,15 @@
-import json
+import asyncio
 import logging
-import os
+import random
 import re
+import threading
 import uuid
 from datetime import datetime, timezone
 import numpy as np
+import cv2
 import albumentations as A
 from pathlib import Path
-import fitz
-from PIL import Image
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from document_pipeline.topic_generation import generate_topic
 from document_pipeline.content_generation import generate_text
@@ -17,6 +17,7 @@ from document_pipeline.text_split import split_to_blocks
 from document_pipeline.layout_generation import generate_layout
 from utils.generate_json_with_sizes import generate_json_with_sizes
 from utils.render_ans import render_blocks_json_to_pdf
+from utils.pipeline_io import PIPELINE_DEBUG, render_first_page, write_json
 
 logger = logging.getLogger(__name__)
 
@@ -37,149 +38,209 @@ def make_next_run_dir(OUT_ROOT : Path) -> Path:
 
 
 def _bleed_through_image(x, **kwargs):
-    """Approximate bleed-through by mixing the image with a flipped copy."""
-    x_f = x.astype(np.float32)
-    flipped_f = np.flip(x, axis=1).astype(np.float32)
+    """Approximate bleed-through by mixing the image with a flipped copy.
+
+    cv2.addWeighted computes x*a + flipped*b + c and saturates to uint8 in one SIMD pass,
+    without the float32 temporaries a NumPy expression would allocate.
+    """
     a = 0.78 + 0.07 * np.random.rand()
     b = 0.10 + 0.20 * np.random.rand()
     c = 8.0 * np.random.rand()
-    return (x_f * a + flipped_f * b + c).clip(0, 255).astype(np.uint8)
+    return cv2.addWeighted(x, a, cv2.flip(x, 1), b, c)
+
+
+# Built once: constructing the Compose (and validating every transform's params) per page is wasted work.
+_AUGMENT = A.Compose(
+    [
+        A.OneOf(
+            [
+                A.GaussianBlur(blur_limit=(1, 3), p=1.0),
+                A.MotionBlur(blur_limit=(3, 5), p=1.0),
+            ],
+            p=0.5,
+        ),
+        A.OneOf(
+            [
+                A.GaussNoise(std_range=(0.03, 0.18), mean_range=(0.0, 0.0), p=1.0),
+                A.ISONoise(color_shift=(0.03, 0.10), intensity=(0.3, 1.0), p=1.0),
+            ],
+            p=0.85,
+        ),
+        A.OneOf(
+            [
+                A.CoarseDropout(
+                    num_holes_range=(200, 1200),
+                    hole_height_range=(1, 2),
+                    hole_width_range=(1, 2),
+                    fill=0,
+                    p=1.0,
+                ),
+                A.CoarseDropout(
+                    num_holes_range=(200, 1200),
+                    hole_height_range=(1, 2),
+                    hole_width_range=(1, 2),
+                    fill=255,
+                    p=1.0,
+                ),
+            ],
+            p=0.7,
+        ),
+        A.Lambda(image=_bleed_through_image, p=0.6),
+        A.OneOf(
+            [
+                A.RGBShift(r_shift_limit=(0, 20), g_shift_limit=(0, 20), b_shift_limit=(-20, 0), p=1.0),
+                A.ToGray(p=1.0),
+                A.HueSaturationValue(hue_shift_limit=0, sat_shift_limit=(-35, -10), val_shift_limit=0, p=1.0),
+            ],
+            p=0.75,
+        ),
+        A.RandomBrightnessContrast(brightness_limit=0.18, contrast_limit=0.12, p=0.7),
+        A.ImageCompression(
+            quality_range=(60, 75),
+            p=0.6,
+        ),
+    ]
+)
+
+
+# ReportLab text measurement and rendering share process-global TTFont objects and are not
+# documented as thread-safe; concurrent runs of one worker take turns in _build_sample.
+_BUILD_LOCK = threading.Lock()
 
 
 def augment_image(
-    pdf_path: str,
+    pdf: str | bytes,
     dpi: int,
     out_image_path: str,
 ) -> None:
+    """Rasterize page 0 of `pdf` (a path or the PDF bytes), augment it and save as JPEG."""
 
     out_path = Path(out_image_path)
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
-    doc = fitz.open(str(Path(pdf_path)))
-
-    try:
-        page = doc.load_page(0)
-        matrix = fitz.Matrix(dpi / 72.0, dpi / 72.0)
-        pix = page.get_pixmap(matrix=matrix, alpha=False)
-        pil_img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples).convert("RGB")
-        img = np.array(pil_img)
-
-        aug = A.Compose(
-            [
-                A.OneOf(
-                    [
-                        A.GaussianBlur(blur_limit=(1, 3), p=1.0),
-                        A.MotionBlur(blur_limit=(3, 5), p=1.0),
-                    ],
-                    p=0.5,
-                ),
-                A.OneOf(
-                    [
-                        A.GaussNoise(std_range=(0.03, 0.18), mean_range=(0.0, 0.0), p=1.0),
-                        A.ISONoise(color_shift=(0.03, 0.10), intensity=(0.3, 1.0), p=1.0),
-                    ],
-                    p=0.85,
-                ),
-                A.OneOf(
-                    [
-                        A.CoarseDropout(
-                            num_holes_range=(200, 1200),
-                            hole_height_range=(1, 2),
-                            hole_width_range=(1, 2),
-                            fill=0,
-                            p=1.0,
-                        ),
-                        A.CoarseDropout(
-                            num_holes_range=(200, 1200),
-                            hole_height_range=(1, 2),
-                            hole_width_range=(1, 2),
-                            fill=255,
-                            p=1.0,
-                        ),
-                    ],
-                    p=0.7,
-                ),
-                A.Lambda(image=_bleed_through_image, p=0.6),
-                A.OneOf(
-                    [
-                        A.RGBShift(r_shift_limit=(0, 20), g_shift_limit=(0, 20), b_shift_limit=(-20, 0), p=1.0),
-                        A.ToGray(p=1.0),
-                        A.HueSaturationValue(hue_shift_limit=0, sat_shift_limit=(-35, -10), val_shift_limit=0, p=1.0),
-                    ],
-                    p=0.75,
-                ),
-                A.RandomBrightnessContrast(brightness_limit=0.18, contrast_limit=0.12, p=0.7),
-                A.ImageCompression(
-                    quality_range=(60, 75),
-                    p=0.6,
-                ),
-            ]
-        )
+    pix = render_first_page(pdf, dpi)
+    # View the pixmap bytes as HxWx3 directly (alpha=False -> RGB); the augmentations never write
+    # into their input, so the read-only buffer is fine and PIL's two extra copies are avoided.
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+    out = _AUGMENT(image=img)["image"]
+
+    # Encode with OpenCV's libjpeg-turbo (SIMD DCT/Huffman) rather than PIL; same settings as
+    # before: quality 70, optimized Huffman tables, progressive, 4:2:0 chroma subsampling.
+    q = 70
+    ok, buf = cv2.imencode(
+        ".jpg",
+        cv2.cvtColor(out, cv2.COLOR_RGB2BGR),
+        [
+            cv2.IMWRITE_JPEG_QUALITY, q,
+            cv2.IMWRITE_JPEG_OPTIMIZE, 1,
+            cv2.IMWRITE_JPEG_PROGRESSIVE, 1,
+            cv2.IMWRITE_JPEG_SAMPLING_FACTOR, cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420,
+        ],
+    )
+    if not ok:
+        raise RuntimeError(f"JPEG encoding failed for {out_path}")
+    out_path.write_bytes(buf.tobytes())
 
-        out = aug(image=img)["image"]
-        pil_out = Image.fromarray(out).convert("RGB")
 
-        q = 70
-        pil_out.save(
-            str(out_path),
-            format="JPEG",
-            quality=q,
-            optimize=True,
-            progressive=True,
-            subsampling=2,
-        )
-    finally:
-        doc.close()
+def _build_sample(text: str, style_map: Dict[str, Dict[str, float]], run_dir: Path, debug: bool,
+                  rng: random.Random) -> bytes:
+    """CPU/disk-bound part of the pipeline: split -> sizes -> layout -> render. Returns the PDF bytes.
 
+    The PDF is only an intermediate for rasterization, so it is rendered in memory instead of
+    being written to the run directory and removed again.
+    """
+    with _BUILD_LOCK:
+        return _build_sample_locked(text, style_map, run_dir, debug, rng)
 
-def doc_pipeline(sampled_persona: str, style_map: Dict[str, Dict[str, float]], out_path : str | Path, base_url: str) -> Path:
 
-    MODEL = "mistralai/Mistral-Nemo-Instruct-2407"
-
-    run_dir = make_next_run_dir(Path(out_path))
-    #logger.info("Run directory: %s", str(run_dir))
-    
-    topic = generate_topic(sampled_persona, model=MODEL, base_url=base_url)
-    #logger.info("Topic: %s", topic)
-
-    text = generate_text(sampled_persona, topic, model=MODEL, base_url=base_url)
-    #logger.info("Text: %s", text)
+def _build_sample_locked(text: str, style_map: Dict[str, Dict[str, float]], run_dir: Path, debug: bool,
+                         rng: random.Random) -> bytes:
 
     split_json = split_to_blocks(text)
-    # out_path = run_dir / "split.json"
-    # with open(out_path, "w", encoding="utf-8") as f:
-    #     json.dump(split_json, f, ensure_ascii=False, indent=2)
-    #logger.info("Split saved to: %s", str(out_path))
+    if debug:
+        out_path = run_dir / "split.json"
+        write_json(out_path, split_json)
+        logger.info("Split saved to: %s", str(out_path))
 
-    json_with_bbox_sizes = generate_json_with_sizes(split_json, style_map=style_map)
-    # out_path = run_dir / "json_with_bbox_sizes.json"
-    # with open(out_path, "w", encoding="utf-8") as f:
-    #     json.dump(json_with_bbox_sizes, f, ensure_ascii=False, indent=2)
-    # logger.info("json_with_bbox_sizes saved to: %s", str(out_path))
+    json_with_bbox_sizes = generate_json_with_sizes(split_json, style_map=style_map, rng=rng)
+    if debug:
+        out_path = run_dir / "json_with_bbox_sizes.json"
+        write_json(out_path, json_with_bbox_sizes)
+        logger.info("json_with_bbox_sizes saved to: %s", str(out_path))
 
     final_layout = generate_layout(data=json_with_bbox_sizes, style_map=style_map)
     out_path = f"{str(run_dir)}/ans.json"
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(final_layout, f, ensure_ascii=False, indent=2)
+    write_json(out_path, final_layout)
     #logger.info("Layout saved to: %s", str(out_path))
 
-    pdf_path = render_blocks_json_to_pdf(
-        json_path=f"{str(run_dir)}/ans.json",
-        out_pdf_path=f"{str(run_dir)}/out.pdf",
+    pdf_bytes = render_blocks_json_to_pdf(
+        json_path=None,
+        out_pdf_path=None,
         draw_frames=False,
         draw_word_bboxes=False,
         style_map=style_map,
+        data=final_layout,
     )
-    #logger.info("Render saved to: %s", pdf_path)
 
-    aug_img_path = f"{str(run_dir)}/doc.jpg"
-    augment_image(
-        pdf_path=pdf_path,
-        dpi=style_map["dpi"],
-        out_image_path=aug_img_path
+    return pdf_bytes
+
+
+async def doc_pipeline(sampled_persona: str, style_map: Dict[str, Dict[str, float]], out_path : str | Path, base_url: str,
+                       debug: bool = PIPELINE_DEBUG, rng: Optional[random.Random] = None) -> Path:
+    """Generate one document sample.
+
+    LLM calls are awaited on the shared AsyncOpenAI client so that many pipelines can be in flight
+    against the same vLLM server; the CPU/disk-bound tail runs in the default executor so it does
+    not block the event loop. Block splitting and widths draw from `rng` (a fresh Random if None),
+    never from the global RNG that concurrent runs would share.
+    """
+
+    MODEL = "mistralai/Mistral-Nemo-Instruct-2407"
+
+    run_dir = make_next_run_dir(Path(out_path))
+    #logger.info("Run directory: %s", str(run_dir))
+    
+    topic = await generate_topic(sampled_persona, model=MODEL, base_url=base_url)
+    #logger.info("Topic: %s", topic)
+
+    text = await generate_text(sampled_persona, topic, model=MODEL, base_url=base_url)
+    #logger.info("Text: %s", text)
+
+    loop = asyncio.get_running_loop()
+    pdf_bytes = await loop.run_in_executor(
+        None, _build_sample, text, style_map, run_dir, debug, rng or random.Random()
     )
+
+    aug_img_path = f"{str(run_dir)}/doc.jpg"
+    await loop.run_in_executor(None, augment_image, pdf_bytes, style_map["dpi"], aug_img_path)
     #logger.info("Augmented page saved to: %s", aug_img_path)
 
-    os.remove(pdf_path)
+    return run_dir
+
 
-    return run_dir
\ No newline at end of file
+async def run_many(
+    personas: List[str],
+    style_maps: List[Dict[str, Dict[str, float]]],
+    out_path: str | Path,
+    base_url: str,
+    max_concurrency: int = 32,
+) -> List[Path | BaseException]:
+    """Run one `doc_pipeline` per (persona, style_map) pair concurrently.
+
+    At most `max_concurrency` pipelines are in flight at once, so vLLM can batch their decode steps.
+    Results keep the input order; a failed run yields its exception instead of a run directory.
+    """
+    if len(personas) != len(style_maps):
+        raise ValueError("personas and style_maps must have the same length")
+
+    sem = asyncio.Semaphore(max_concurrency)
+
+    async def guarded(persona: str, style_map: Dict[str, Dict[str, float]]) -> Path:
+        async with sem:
+            return await doc_pipeline(persona, style_map, out_path=out_path, base_url=base_url)
+
+    return await asyncio.gather(
+        *(guarded(p, sm) for p, sm in zip(personas, style_maps)),
+        return_exceptions=True,
+    )
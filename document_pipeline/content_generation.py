@@ -1,12 +1,15 @@
+import asyncio
 import os
 import re
-from openai import OpenAI
-from functools import lru_cache
 
+from utils.openai_clients import get_async_openai_client
+from utils.llm_cache import cache_get, cache_key, cache_set
 
+
+# Static instructions first, persona/topic last: every request then shares the same long token prefix,
+# which vLLM's automatic prefix caching reuses instead of re-running prefill.
 GENERATE_DOCUMENT_DATA_PROMPT = """You are an expert in content creation and have broad knowledge about various topics.
-My persona is: "{persona}"
-I need materials about "{topic}" that can be used to generate a realistic document.
+I need materials about the topic given at the end that can be used to generate a realistic document for the persona given at the end.
 
 Here are the requirements:
 1. The materials must be directly related to the topic and customized according to the given persona.
@@ -23,15 +26,23 @@ Here are the requirements:
 - If lists are helpful for clarity, include bullet list OR numbered list.
 - Any list must be contextually appropriate (e.g., steps, criteria, pros/cons, checklist). If not appropriate, use normal paragraphs instead.
 - Include concrete numbers where appropriate. Numbers must be plausible and consistent with the topic.
-- Keep the tone professional and realistic; avoid generic fluff."""
+- Keep the tone professional and realistic; avoid generic fluff.
 
+My persona is: "{persona}"
+Topic: "{topic}"
+"""
+
+TEXT_SYSTEM_PROMPT = "Return ONLY the document body as plain text in Russian. Do not add any extra commentary. Do NOT use markdown"
+TEXT_TEMPERATURE = 0.7
 
-@lru_cache(maxsize=32)
-def _get_openai_client(base_url: str) -> OpenAI:
-    return OpenAI(
-        base_url=base_url,
-        api_key="EMPTY",
-    )
+
+
+# Word characters that are not digits/underscore and not basic Latin or Cyrillic:
+#   Cyrillic U+0400-04FF, Supplement U+0500-052F, Extended-A U+2DE0-2DFF,
+#   Extended-B U+A640-A69F, Extended-C U+1C80-1C8F.
+_NON_LATIN_CYRILLIC_CANDIDATE_RE = re.compile(
+    r"[^\W\d_A-Za-z\u0400-\u052F\u2DE0-\u2DFF\uA640-\uA69F\u1C80-\u1C8F]"
+)
 
 
 def _contains_non_latin_or_cyrillic_letters(text: str) -> bool:
@@ -46,44 +57,56 @@ def _contains_non_latin_or_cyrillic_letters(text: str) -> bool:
     if not text:
         return False
 
-    for ch in text:
-        if ch.isalpha():
-            code = ord(ch)
-            is_basic_latin = (0x0041 <= code <= 0x005A) or (0x0061 <= code <= 0x007A)
-            is_cyrillic = (
-                (0x0400 <= code <= 0x04FF)  # Cyrillic
-                or (0x0500 <= code <= 0x052F)  # Cyrillic Supplement
-                or (0x2DE0 <= code <= 0x2DFF)  # Cyrillic Extended-A
-                or (0xA640 <= code <= 0xA69F)  # Cyrillic Extended-B
-                or (0x1C80 <= code <= 0x1C8F)  # Cyrillic Extended-C
-            )
-            if not (is_basic_latin or is_cyrillic):
-                return True
+    # The C-level regex scan skips the (typical) all-allowed text in one pass; the rare candidates
+    # it yields are confirmed with str.isalpha() to keep the exact "alphabetic letter" semantics.
+    for m in _NON_LATIN_CYRILLIC_CANDIDATE_RE.finditer(text):
+        if m.group().isalpha():
+            return True
 
     return False
 
 
-def generate_text(persona: str, topic: str, model: str, base_url: str) -> str:
+async def generate_text(persona: str, topic: str, model: str, base_url: str) -> str:
 
-    client = _get_openai_client(base_url)
+    client = get_async_openai_client(base_url)
 
     prompt = GENERATE_DOCUMENT_DATA_PROMPT.format(persona=persona, topic=topic)
 
-    completion = client.chat.completions.create(
+    key = cache_key(model, TEXT_SYSTEM_PROMPT, prompt, TEXT_TEMPERATURE)
+    cached = await asyncio.to_thread(cache_get, key)
+    if cached is not None:
+        return cached
+
+    # Stream the completion so a reply that drifts into another script is cut off at the first
+    # offending chunk instead of after the full max_tokens decode.
+    stream = await client.chat.completions.create(
         model=model,
         messages=[
-            {"role": "system", "content": "Return ONLY the document body as plain text in Russian. Do not add any extra commentary. Do NOT use markdown"},
+            {"role": "system", "content": TEXT_SYSTEM_PROMPT},
             {"role": "user", "content": prompt},
         ],
-        temperature=0.7,
+        temperature=TEXT_TEMPERATURE,
         max_tokens=3000,
+        stream=True,
     )
 
-    text = (completion.choices[0].message.content or "").strip()
-
-    if _contains_non_latin_or_cyrillic_letters(text):
-        raise ValueError(
-            "Generated text contains letters outside English/Russian alphabets; aborting."
-        )
-
-    return text
\ No newline at end of file
+    parts: list[str] = []
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if _contains_non_latin_or_cyrillic_letters(delta):
+                raise ValueError(
+                    "Generated text contains letters outside English/Russian alphabets; aborting."
+                )
+            parts.append(delta)
+    finally:
+        await stream.close()
+
+    text = "".join(parts).strip()
+
+    await asyncio.to_thread(cache_set, key, text)
+    return text
@@ -1,9 +1,28 @@
-from copy import deepcopy
 import math
-from typing import Any, Dict, List, Optional
-from reportlab.pdfbase import pdfmetrics
+import numpy as np
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
-from utils.count_bbox_size import get_font_vmetrics_pt, pt_to_px
+from utils.count_bbox_size import space_width_pt
+
+
+class _TextStyle(NamedTuple):
+    """Word-layout metrics of one block type, in px."""
+    padding_px: float
+    space_px: float
+    leading_px: float
+
+
+def _validate_blocks(blocks: List[Any]) -> None:
+    """One-shot shape check of the input blocks, so the packing loop can assume well-formed data."""
+    for b in blocks:
+        if not isinstance(b, dict):
+            raise ValueError("Каждый элемент blocks должен быть объектом (dict)")
+
+        if "content" not in b or not isinstance(b["content"], str):
+            raise ValueError(f"У блока {b.get('id')} нет корректного content (ожидаю строку)")
+
+        if "bbox_size" not in b or not isinstance(b["bbox_size"], (list, tuple)) or len(b["bbox_size"]) != 2:
+            raise ValueError(f"У блока {b.get('id')} нет корректного bbox_size=[w,h]")
 
 
 def generate_layout(
@@ -35,7 +54,9 @@ def generate_layout(
     gutter = int(style_map.get("gutter", 40))
     v_gap = int(style_map.get("v_gap", 24))
 
-    out = deepcopy(data)
+    # Shallow rebuild: every laid-out block gets a fresh dict below and its bbox/bbox_size/words
+    # are replaced, so deep-copying the input (down to every word dict) buys nothing.
+    out = {k: v for k, v in data.items() if k != "blocks"}
 
     # Геометрия страницы
     full_w = page_w - 2 * margin
@@ -60,16 +81,39 @@ def generate_layout(
     col_idx = 0  # текущая колонка для узких блоков
 
     laid_blocks: List[Dict[str, Any]] = []
+    # Page extent (rightmost/bottommost block edge), tracked while placing instead of in a final pass.
+    max_x2, max_y2 = 0, 0
+
+    # Blocks of the same type share their metrics: resolve them once per (type, padding), not per block.
+    text_styles: Dict[Tuple[str, float], _TextStyle] = {}
 
-    def fits(y: int, h: int) -> bool:
-        return (y + h) <= bottom_y
+    def resolve_text_style(type_of_content: str, padding_pt: float) -> _TextStyle:
+        key = (type_of_content, padding_pt)
+        ts = text_styles.get(key)
+        if ts is not None:
+            return ts
+
+        st = style_map[type_of_content]
+        font_name = st["font_name"]
+        font_size_pt = float(st["font_size"])
+        dpi_used = int(style_map["dpi"])
+
+        ts = _TextStyle(
+            # pt -> px inline (same pt * dpi / 72 as pt_to_px, so values are bit-identical).
+            padding_px=float(padding_pt) * dpi_used / 72.0,
+            # Space width in px for the current font.
+            space_px=space_width_pt(font_name, font_size_pt) * dpi_used / 72.0,
+            leading_px=float(st["leading"]) * dpi_used / 72.0,
+        )
+        text_styles[key] = ts
+        return ts
 
     def layout_words(
         b: Dict[str, Any],
         *,
         padding_pt: int,
         type_of_content: str,
-        block_bbox: List[int],
+        block_bbox: Tuple[int, int, int, int],
     ) -> Optional[List[Dict[str, Any]]]:
         """Compute per-word bbox positions for text blocks.
 
@@ -82,12 +126,10 @@ def generate_layout(
         if not isinstance(words, list) or len(words) == 0:
             return None
 
-        st = style_map[type_of_content]
-        font_name = st["font_name"]
-        font_size_pt = float(st["font_size"])
-
-        dpi_used = int(style_map["dpi"])
-        padding_px = pt_to_px(float(padding_pt), dpi_used)
+        ts = resolve_text_style(type_of_content, padding_pt)
+        padding_px = ts.padding_px
+        space_px = ts.space_px
+        leading_px = ts.leading_px
 
         # Padded inner box for words.
         left = float(block_bbox[0]) + padding_px
@@ -95,87 +137,55 @@ def generate_layout(
         right = float(block_bbox[2]) - padding_px
         bottom = float(block_bbox[3]) - padding_px
 
-        # Space width in px for the current font.
-        space_w_pt = float(pdfmetrics.stringWidth(" ", font_name, font_size_pt))
-        space_px = pt_to_px(space_w_pt, dpi_used)
-
-        # Vertical metrics: keep line height and leading separated (both converted to px).
-        # get_font_vmetrics_pt returns (ascent_pt, descent_pt, line_h_pt) in points.
-        leading_pt = float(st["leading"])
-        _, _, line_h_pt = get_font_vmetrics_pt(font_name, font_size_pt)
-
-        base_line_h_px = pt_to_px(float(line_h_pt), dpi_used)
-        leading_px = pt_to_px(float(leading_pt), dpi_used)
-
-        # Track current line height (px) within the current line.
-        # Leading is applied only once on newline.
-        current_line_h = float(base_line_h_px)
-
-        def _new_line(line_h_px: float) -> None:
-            nonlocal cursor_x, cursor_y, current_line_h
-            cursor_x = left
-            cursor_y = cursor_y + float(leading_px)
-            current_line_h = float(base_line_h_px)
-
         # Cursor starts at padded top-left.
+        # Leading is applied only once on newline; the line height itself does not move the cursor.
         cursor_x = left
         cursor_y = top
 
-        out_words: List[Dict[str, Any]] = []
+        # Words that get a bbox (explicit "\n" tokens only move the cursor) and their float positions.
+        placed_src: List[Dict[str, Any]] = []
+        xs: List[float] = []
+        ys: List[float] = []
+        wws: List[float] = []
+        whs: List[float] = []
 
         # Track which placed words belong to which logical line (separated by explicit "\n" tokens).
         # Each element stores indices into `out_words`.
         line_word_indices: List[List[int]] = [[]]
+        cur_line = line_word_indices[0]
 
+        # Hot loop: plain locals and inline arithmetic only (no closures/nonlocal rebinding per word).
         for w in words:
             content = w["content"]
-            bbox_size = w["bbox_size"]
-
-            ww = float(bbox_size[0])
-            wh = float(bbox_size[1])
-
-            # Update current line height based on word height.
-            current_line_h = max(current_line_h, wh)
 
             # Handle explicit newline token. We assume it's provided as a separate token.
             if content == "\n":
-                _new_line(current_line_h)
+                cursor_x = left
+                cursor_y += leading_px
                 # Start a new logical line for overlap post-processing.
-                line_word_indices.append([])
+                cur_line = []
+                line_word_indices.append(cur_line)
                 continue
 
-            # Place bbox at current cursor.
-            x1 = cursor_x
-            y1 = cursor_y
-            x2 = x1 + ww
-            y2 = y1 + wh
-
-            ww_out = int(bbox_size[0])
-            wh_out = int(bbox_size[1])
-            placed = {
-                "content": content,
-                "bbox_size": [ww_out, wh_out],
-                "bbox": [int(round(x1)), int(round(y1)), int(round(x1 + ww)), int(round(y1 + wh))],
-            }
-            # Preserve any extra fields from the input word dict (without overwriting bbox_size/bbox).
-            for k, v in w.items():
-                if k in ("content", "bbox_size", "bbox"):
-                    continue
-                placed[k] = v
+            bbox_size = w["bbox_size"]
+            ww = float(bbox_size[0])
+            wh = float(bbox_size[1])
 
-            out_words.append(placed)
+            # Place bbox at current cursor.
+            placed_src.append(w)
+            xs.append(cursor_x)
+            ys.append(cursor_y)
+            wws.append(ww)
+            whs.append(wh)
 
             # Remember which line this word belongs to.
-            line_word_indices[-1].append(len(out_words) - 1)
+            cur_line.append(len(placed_src) - 1)
 
             # Advance cursor to next word (word width + space).
             cursor_x = cursor_x + ww + space_px
 
-        def _fix_vertical_overlaps(
-            placed_words: List[Dict[str, Any]],
-            lines: List[List[int]],
-        ) -> None:
-            """If bboxes from adjacent lines overlap in Y, adjust the boundary.
+        def _fix_vertical_overlaps(bboxes: np.ndarray, lines: List[List[int]]) -> None:
+            """If bboxes from adjacent lines overlap in Y, adjust the boundary (in place on int bbox rows).
 
             For each pair of adjacent lines (i, i+1):
             - Let upper_bottom = max(y2) among words in line i
@@ -186,101 +196,120 @@ def generate_layout(
             - For all words in lower line: y1 := max(y1, boundary)
 
             This makes the lower boundary of the upper line and the upper boundary of the lower line equal to the harmonic mean.
-            """
 
-            for i in range(len(lines) - 1):
-                upper = lines[i]
-                lower = lines[i + 1]
+            Vectorized over all lines at once: a pair only changes the y2 of its upper line and the y1 of
+            its lower line, so every boundary can be computed from the unclamped boxes. Per word the lower
+            clamp (pair i-1) is applied before the upper one (pair i), as in the sequential pass.
+            """
 
-                # Skip empty logical lines (possible with consecutive '\n').
-                if not upper or not lower:
+            n_lines = len(lines)
+            if n_lines < 2:
+                return
+
+            counts = np.fromiter((len(line) for line in lines), dtype=np.int64, count=n_lines)
+            nonempty = counts > 0
+            # Words were appended line by line, so each line is a contiguous run of rows.
+            starts = np.cumsum(counts) - counts
+
+            y1 = bboxes[:, 1]
+            y2 = bboxes[:, 3]
+
+            line_bottom = np.zeros(n_lines, dtype=np.float64)
+            line_top = np.zeros(n_lines, dtype=np.float64)
+            line_bottom[nonempty] = np.maximum.reduceat(y2, starts[nonempty])
+            line_top[nonempty] = np.minimum.reduceat(y1, starts[nonempty])
+
+            upper_bottom = line_bottom[:-1]
+            lower_top = line_top[1:]
+            # Skip empty logical lines (possible with consecutive '\n') and pairs without overlap.
+            overlap = nonempty[:-1] & nonempty[1:] & (upper_bottom > lower_top)
+            if not overlap.any():
+                return
+
+            denom = upper_bottom + lower_top
+            # Use harmonic mean for the shared boundary (np.rint == round(), half to even).
+            with np.errstate(divide="ignore", invalid="ignore"):
+                boundary = np.where(denom != 0.0, 2.0 * upper_bottom * lower_top / denom, 0.0)
+            b_int = np.rint(boundary).astype(np.int64)
+
+            line_of_word = np.repeat(np.arange(n_lines), counts)
+
+            # Clamp the lower line tops to the boundary (ensuring non-negative height).
+            has_lower = np.zeros(n_lines, dtype=bool)
+            has_lower[1:] = overlap
+            lower_b = np.zeros(n_lines, dtype=np.int64)
+            lower_b[1:] = b_int
+            wb = lower_b[line_of_word]
+            m = has_lower[line_of_word] & (y1 < wb)
+            y1[m] = np.minimum(wb[m], y2[m])
+
+            # Clamp the upper line bottoms to the boundary (ensuring non-negative height).
+            has_upper = np.zeros(n_lines, dtype=bool)
+            has_upper[:-1] = overlap
+            upper_b = np.zeros(n_lines, dtype=np.int64)
+            upper_b[:-1] = b_int
+            wb = upper_b[line_of_word]
+            m = has_upper[line_of_word] & (y2 > wb)
+            y2[m] = np.maximum(wb[m], y1[m])
+
+        # Round all bboxes in one NumPy pass instead of four round() calls per word.
+        # np.rint rounds half to even, exactly like round() on floats; astype truncates like int().
+        if placed_src:
+            x1 = np.asarray(xs)
+            y1 = np.asarray(ys)
+            ww_arr = np.asarray(wws)
+            wh_arr = np.asarray(whs)
+            bboxes = np.rint(np.stack((x1, y1, x1 + ww_arr, y1 + wh_arr), axis=1)).astype(np.int64)
+            _fix_vertical_overlaps(bboxes, line_word_indices)
+            bbox_lists = bboxes.tolist()
+            size_lists = np.stack((ww_arr, wh_arr), axis=1).astype(np.int64).tolist()
+        else:
+            bbox_lists = []
+            size_lists = []
+
+        # Materialize the output dicts once from the columns above.
+        out_words: List[Dict[str, Any]] = [
+            {"content": w["content"], "bbox_size": size, "bbox": bbox}
+            for w, size, bbox in zip(placed_src, size_lists, bbox_lists)
+        ]
+
+        # Preserve any extra fields from the input word dict (without overwriting bbox_size/bbox).
+        # Words normally carry only content + bbox_size, so this is skipped for them.
+        for w, placed in zip(placed_src, out_words):
+            if len(w) <= 2:
+                continue
+            for k, v in w.items():
+                if k in ("content", "bbox_size", "bbox"):
                     continue
-
-                upper_bottom = max(float(placed_words[idx]["bbox"][3]) for idx in upper)
-                lower_top = min(float(placed_words[idx]["bbox"][1]) for idx in lower)
-
-                if upper_bottom <= lower_top:
-                    continue  # no overlap
-
-                denom = (upper_bottom + lower_top)
-                # Use harmonic mean for the shared boundary.
-                boundary = (2.0 * upper_bottom * lower_top / denom) if denom != 0.0 else 0.0
-                b_int = int(round(boundary))
-
-                # Clamp the upper line bottoms to the boundary.
-                for idx in upper:
-                    bb = placed_words[idx]["bbox"]
-                    if bb[3] > b_int:
-                        bb[3] = b_int
-                        # Ensure non-negative height.
-                        if bb[3] < bb[1]:
-                            bb[3] = bb[1]
-
-                # Clamp the lower line tops to the boundary.
-                for idx in lower:
-                    bb = placed_words[idx]["bbox"]
-                    if bb[1] < b_int:
-                        bb[1] = b_int
-                        # Ensure non-negative height.
-                        if bb[1] > bb[3]:
-                            bb[1] = bb[3]
-
-        _fix_vertical_overlaps(out_words, line_word_indices)
+                placed[k] = v
 
         return out_words
 
-    for b in out["blocks"]:
-        if not isinstance(b, dict):
-            raise ValueError("Каждый элемент blocks должен быть объектом (dict)")
-
-        if "content" not in b or not isinstance(b["content"], str):
-            raise ValueError(f"У блока {b.get('id')} нет корректного content (ожидаю строку)")
-
-        if "bbox_size" not in b or not isinstance(b["bbox_size"], (list, tuple)) or len(b["bbox_size"]) != 2:
-            raise ValueError(f"У блока {b.get('id')} нет корректного bbox_size=[w,h]")
+    blocks = data["blocks"]
+    _validate_blocks(blocks)
 
+    for b in blocks:
         w0, h0 = int(b["bbox_size"][0]), int(b["bbox_size"][1])
         
+        is_full = w0 > col_w
+
         # 1) FULL-WIDTH блок (шире колонки)
-        if w0 > col_w:
+        if is_full:
             if h0 > max_col_h:
                 raise ValueError(
                     f"Блок {b.get('id')} слишком высокий для страницы: h={h0} > max_h={max_col_h}. "
                     f"Нужно уменьшить bbox_size или реализовать разбиение блока."
                 )
 
-            y1 = max(y_col[0], y_col[1])
-            if not fits(y1, h0):
+            # Lower of the two column cursors, without a builtin max() call per block.
+            y1 = y_col[0] if y_col[0] > y_col[1] else y_col[1]
+            if (y1 + h0) > bottom_y:
                 raise ValueError(
                     f"Блок {b.get('id')} не помещается на страницу: не хватает места по высоте для full-width блока."
                 )
 
             x1 = margin
-            y2 = y1 + h0
-            x2 = x1 + w0
-
-            bb = deepcopy(b)
-            bb["bbox_size"] = [w0, h0]
-            bb["bbox"] = [x1, y1, x2, y2]
-            bb["font"] = style_map[bb["type"]]["font_name"]
 
-            words_laid = layout_words(
-                bb,
-                padding_pt=style_map["padding_pt"],
-                type_of_content=bb["type"],
-                block_bbox=bb["bbox"],
-            )
-            if words_laid is not None:
-                bb["words"] = words_laid
-
-            laid_blocks.append(bb)
-
-            # full-width блок "срезает" обе колонки — продолжаем ниже него
-            next_y = y2 + v_gap
-            y_col[0] = next_y
-            y_col[1] = next_y
-            # col_idx оставляем как есть (чтобы заполнение продолжалось привычно)
-            
         # 2) Обычный (колоночный) блок
         else:
             if h0 > max_col_h:
@@ -291,11 +320,11 @@ def generate_layout(
 
             # пробуем текущую колонку
             y_try = y_col[col_idx]
-            if not fits(y_try, h0):
+            if (y_try + h0) > bottom_y:
                 # не влезает — пробуем другую колонку, начиная с её текущего y (наивысшая свободная строка)
                 other = 1 - col_idx
                 y_try_other = y_col[other]
-                if fits(y_try_other, h0):
+                if (y_try_other + h0) <= bottom_y:
                     col_idx = other
                     y_try = y_try_other
                 else:
@@ -305,14 +334,18 @@ def generate_layout(
 
             x1 = col_x[col_idx]
             y1 = y_try
-            x2 = x1 + w0
-            y2 = y1 + h0
 
-            bb = deepcopy(b)
-            bb["bbox_size"] = [w0, h0]
-            bb["bbox"] = [x1, y1, x2, y2]
-            bb["font"] = style_map[bb["type"]]["font_name"]
+        # Shared tail: only the position and the cursor update differ between the two kinds of block.
+        x2 = x1 + w0
+        y2 = y1 + h0
+
+        bb = dict(b)
+        bb["bbox_size"] = (w0, h0)
+        bb["bbox"] = (x1, y1, x2, y2)
+        bb["font"] = style_map[bb["type"]]["font_name"]
 
+        # Blocks without words skip the call (and its style/metric resolution) entirely.
+        if bb.get("words"):
             words_laid = layout_words(
                 bb,
                 padding_pt=style_map["padding_pt"],
@@ -322,21 +355,24 @@ def generate_layout(
             if words_laid is not None:
                 bb["words"] = words_laid
 
-            laid_blocks.append(bb)
+        laid_blocks.append(bb)
+        if x2 > max_x2:
+            max_x2 = x2
+        if y2 > max_y2:
+            max_y2 = y2
 
+        if is_full:
+            # full-width блок "срезает" обе колонки — продолжаем ниже него
+            next_y = y2 + v_gap
+            y_col[0] = next_y
+            y_col[1] = next_y
+            # col_idx оставляем как есть (чтобы заполнение продолжалось привычно)
+        else:
             y_col[col_idx] = y2 + v_gap
 
     out["blocks"] = laid_blocks
 
     # Clip page
-    max_x2, max_y2 = 0, 0
-    for b in out["blocks"]:
-        bbox = b["bbox"]
-        x2 = int(round(float(bbox[2])))
-        y2 = int(round(float(bbox[3])))
-        max_x2 = max(max_x2, x2)
-        max_y2 = max(max_y2, y2)
-
     out["page"] = {
         "width": int(max_x2 + margin),
         "height": int(max_y2 + margin),
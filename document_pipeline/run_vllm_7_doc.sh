@@ -26,6 +26,7 @@ for GPU in 0 1 2 3 4 5 6; do
       --pipeline-parallel-size 1 \
       --gpu-memory-utilization 0.90 \
       --max-model-len 4096 \
+      --enable-prefix-caching \
       --served-model-name "$MODEL" \
       > "/home/jovyan/people/Glebov/synt_gen_2/logs/vllm_gpu${GPU}.log" 2>&1 &
 done
@@ -1,11 +1,38 @@
 import re
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 # Remove markdown emphasis wrappers like *word* or **phrase with spaces**
 # without crossing line breaks.
 _emph_bold_re = re.compile(r"\*\*([^\n*]+?)\*\*")
 _emph_ital_re = re.compile(r"(?<!\*)\*([^\n*]+?)\*(?!\*)")
 
+# Patterns used by split_to_blocks, compiled once instead of going through re's cache per call.
+_ws_re = re.compile(r"\s+")
+_md_heading_re = re.compile(r"^\s*#{1,6}\s*")
+_list_item_re = re.compile(r"^([-*•]|\d+[.)])\s+")
+_sent_end_re = re.compile(r"[.!?…]\s*$")
+_para_split_re = re.compile(r"\n\s*\n+")
+
+
+def _header_text(line: str) -> Optional[str]:
+    """Return the normalized header text of `line`, or None if the line is not a header.
+
+    Normalizing once here lets split_to_blocks use the result directly instead of
+    re-running the whitespace/heading regexes on every header it peels off.
+    """
+    s = _md_heading_re.sub("", _ws_re.sub(" ", line).strip()).strip()
+    if not s:
+        return None
+    # avoid list items
+    if _list_item_re.match(s):
+        return None
+    words = s.split()
+    if s.endswith(":") and len(words) <= 20:
+        return s
+    if len(words) <= 12 and not _sent_end_re.search(s):
+        return s
+    return None
+
 
 def strip_asterisk_wrappers(text: str) -> str:
     """Remove markdown emphasis wrappers made of asterisks.
@@ -21,12 +48,17 @@ def strip_asterisk_wrappers(text: str) -> str:
     if not isinstance(text, str) or not text:
         return text
 
+    # Most texts have no asterisks at all: one C-level scan instead of two regex passes.
+    if "*" not in text:
+        return text
+
+    # A single pass is not always a fixed point ('****a****' -> '**a**' -> 'a'), so keep the passes,
+    # but stop as soon as one substitutes nothing or leaves no asterisk for the next one to find.
     for _ in range(3):
-        new = _emph_bold_re.sub(r"\1", text)
-        new = _emph_ital_re.sub(r"\1", new)
-        if new == text:
+        text, n_bold = _emph_bold_re.subn(r"\1", text)
+        text, n_ital = _emph_ital_re.subn(r"\1", text)
+        if not (n_bold or n_ital) or "*" not in text:
             break
-        text = new
 
     return text
 
@@ -44,27 +76,15 @@ def split_to_blocks(text: str) -> Dict[str, List[Dict[str, Any]]]:
     """
 
     def norm(s: str) -> str:
-        return re.sub(r"\s+", " ", s).strip()
+        return _ws_re.sub(" ", s).strip()
 
     def strip_md_heading(s: str) -> str:
-        return re.sub(r"^\s*#{1,6}\s*", "", s).strip()
-
-    def is_header(line: str) -> bool:
-        s = strip_md_heading(norm(line))
-        if not s:
-            return False
-        # avoid list items
-        if re.match(r"^([-*•]|\d+[.)])\s+", s):
-            return False
-        words = s.split()
-        if s.endswith(":") and len(words) <= 20:
-            return True
-        if len(words) <= 12 and not re.search(r"[.!?…]\s*$", s):
-            return True
-        return False
-
-    # normalize newlines
-    text = text.replace("\r\n", "\n").replace("\r", "\n").strip()
+        return _md_heading_re.sub("", s).strip()
+
+    # normalize newlines (LLM output rarely has \r, so skip both full-text copies when absent)
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = text.strip()
     text = strip_asterisk_wrappers(text)
     if not text:
         return {"blocks": []}
@@ -73,7 +93,7 @@ def split_to_blocks(text: str) -> Dict[str, List[Dict[str, Any]]]:
     bid = 1
 
     # split text into paragraph-ish chunks by blank lines
-    raw_blocks = [b.strip() for b in re.split(r"\n\s*\n+", text) if b.strip()]
+    raw_blocks = [b.strip() for b in _para_split_re.split(text) if b.strip()]
 
     # Title is always the first paragraph
     title_chunk = raw_blocks[0]
@@ -89,8 +109,10 @@ def split_to_blocks(text: str) -> Dict[str, List[Dict[str, Any]]]:
 
         # peel off consecutive headers at the top of the chunk
         i = 0
-        while i < len(chunk_lines) and is_header(chunk_lines[i]):
-            header_text = strip_md_heading(norm(chunk_lines[i]))
+        for ln in chunk_lines:
+            header_text = _header_text(ln)
+            if header_text is None:
+                break
             blocks.append({"id": f"b{bid}", "type": "header", "content": header_text})
             bid += 1
             i += 1
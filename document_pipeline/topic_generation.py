@@ -1,44 +1,52 @@
+import asyncio
 import os
-from openai import OpenAI
-from functools import lru_cache
 
+from utils.openai_clients import get_async_openai_client
+from utils.llm_cache import cache_get, cache_key, cache_set
 
-GENERATE_DOCUMENT_TOPIC_PROMPT = """You are an expert in document generation and have a broad knowledge of different topics.
-My persona is: "{persona}"
 
-I want you to generate a topic that I will be interested in or that I may encounter in my daily life given my persona.
+# Static instructions first, persona last (shared prefix for vLLM's automatic prefix caching).
+GENERATE_DOCUMENT_TOPIC_PROMPT = """You are an expert in document generation and have a broad knowledge of different topics.
+I want you to generate a topic that I will be interested in or that I may encounter in my daily life given my persona (stated at the end).
 
 Here are the requirements:
 1. The topic should be a high-level summary of a document’s contents with some realistic details (e.g., purpose, context, or key elements).
 2. The topic should be relevant and realistic for the given persona.
-3. The topic must be written in Russian, even if the persona is non-Russian."""
+3. The topic must be written in Russian, even if the persona is non-Russian.
+
+My persona is: "{persona}"
+"""
 
+TOPIC_SYSTEM_PROMPT = "Return ONLY the topic string in Russian. No quotes, no extra text."
+TOPIC_TEMPERATURE = 0.5
 
-@lru_cache(maxsize=32)
-def _get_openai_client(base_url: str) -> OpenAI:
-    return OpenAI(
-        base_url=base_url,
-        api_key="EMPTY",
-    )
 
-def generate_topic(persona: str, model: str, base_url: str) -> str:
+async def generate_topic(persona: str, model: str, base_url: str) -> str:
 
-    client = _get_openai_client(base_url)
+    client = get_async_openai_client(base_url)
 
     prompt = GENERATE_DOCUMENT_TOPIC_PROMPT.format(persona=persona)
 
-    completion = client.chat.completions.create(
+    key = cache_key(model, TOPIC_SYSTEM_PROMPT, prompt, TOPIC_TEMPERATURE)
+    cached = await asyncio.to_thread(cache_get, key)
+    if cached is not None:
+        return cached
+
+    completion = await client.chat.completions.create(
         model=model,
         messages=[
             {
                 "role": "system",
-                "content": "Return ONLY the topic string in Russian. No quotes, no extra text.",
+                "content": TOPIC_SYSTEM_PROMPT,
             },
             {"role": "user", "content": prompt},
         ],
-        temperature=0.5,
+        temperature=TOPIC_TEMPERATURE,
         max_tokens=300,
     )
 
     content = completion.choices[0].message.content
-    return content.replace("\n", "").replace("\r", "").strip()
\ No newline at end of file
+    topic = content.replace("\n", "").replace("\r", "").strip()
+    await asyncio.to_thread(cache_set, key, topic)
+    return topic
+
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import random
@@ -5,18 +6,25 @@ import logging
 import tarfile
 import time
 import shutil
+import subprocess
+import threading
 from pathlib import Path
 from functools import lru_cache
-from typing import Any, Optional
+from typing import Any, NamedTuple, Optional
 from argparse import ArgumentParser
 from tqdm import tqdm
 import boto3
+import io
 import uuid
+from array import array
 import sys
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
 import traceback
 import multiprocessing as mp
 from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
 from queue import Empty
 
 from reportlab.pdfbase import pdfmetrics
@@ -35,62 +43,101 @@ for _name in ("openai", "httpx", "httpcore", "urllib3", "e2b", "e2b.sandbox", "e
     logging.getLogger(_name).setLevel(logging.WARNING)
 
 
-def register_fonts(fonts_dir: str) -> None:
-    """Register every font file in `fonts_dir`.
+# Font names already registered with ReportLab in this process; its registry is process-global,
+# so repeated register_fonts()/ensure_font_registered() calls must not re-parse the same TTF files.
+_REGISTERED_FONTS: set[str] = set()
 
-    Registers all readable .ttf/.otf files found directly inside `fonts_dir`.
-    The font is registered under its filename (including extension), e.g. "Caveat-Bold.ttf".
+
+# Extensions are compared on the lowercased last four characters (same as lower().endswith()).
+_FONT_EXTS = frozenset({".ttf", ".otf"})
+
+
+class _FontDirScan(NamedTuple):
+    ttf_names: tuple[str, ...]  # sampled into style maps
+    registerable: tuple[str, ...]  # .ttf + .otf, registered by register_fonts()
+
+
+@lru_cache(maxsize=8)
+def _scan_fonts_dir(fonts_dir: str, mtime_ns: int) -> _FontDirScan:
+    """One pass over `fonts_dir`: sorted readable font file names, by kind.
+
+    Keyed on the directory mtime, so adding/removing fonts invalidates the entry while
+    repeated calls skip the directory listing and the per-file access checks.
     """
+    # scandir entries carry the file type from the directory read, so is_file() needs no extra stat.
+    ttf_names: list[str] = []
+    font_files: list[str] = []
     try:
-        files = os.listdir(fonts_dir)
+        with os.scandir(fonts_dir) as it:
+            for entry in it:
+                ext = entry.name[-4:].lower()
+                if ext not in _FONT_EXTS:
+                    continue
+                if entry.is_file() and os.access(entry.path, os.R_OK):
+                    font_files.append(entry.name)
+                    if ext == ".ttf":
+                        ttf_names.append(entry.name)
     except Exception as e:
         raise RuntimeError(f"Failed to list fonts_dir={fonts_dir}: {e}")
 
-    font_files: list[str] = []
-    for f in files:
-        lf = f.lower()
-        if not (lf.endswith(".ttf") or lf.endswith(".otf")):
-            continue
-        path = os.path.join(fonts_dir, f)
-        if os.path.isfile(path) and os.access(path, os.R_OK):
-            font_files.append(f)
+    return _FontDirScan(tuple(sorted(set(ttf_names))), tuple(sorted(set(font_files))))
+
+
+def _fonts_dir_scan(fonts_dir: str) -> _FontDirScan:
+    try:
+        mtime_ns = os.stat(fonts_dir).st_mtime_ns
+    except Exception as e:
+        raise RuntimeError(f"Failed to list fonts_dir={fonts_dir}: {e}")
+    return _scan_fonts_dir(fonts_dir, mtime_ns)
+
+
+def register_fonts(fonts_dir: str) -> None:
+    """Register every font file in `fonts_dir`.
 
+    Registers all readable .ttf/.otf files found directly inside `fonts_dir`.
+    The font is registered under its filename (including extension), e.g. "Caveat-Bold.ttf".
+    Fonts already registered by an earlier call are skipped.
+    """
+    font_files = _fonts_dir_scan(fonts_dir).registerable
     if not font_files:
         raise RuntimeError(
             f"No readable .ttf/.otf fonts found in {fonts_dir}. "
             "Check that the directory exists and that the font files are present and readable."
         )
 
-    for font_name in sorted(set(font_files)):
-        path = os.path.join(fonts_dir, font_name)
-        try:
-            pdfmetrics.registerFont(TTFont(font_name, path))
-        except Exception as e:
-            logger.warning("Failed to register font '%s' from '%s': %s", font_name, path, e)
+    for font_name in font_files:
+        ensure_font_registered(fonts_dir, font_name)
 
 
-def sample_random_fonts_for_style_map(style_map: dict[str, Any], fonts_dir: str, *, seed: Optional[int] = None) -> None:
+def ensure_font_registered(fonts_dir: str, font_name: str) -> None:
+    """Register `fonts_dir/font_name` with ReportLab under `font_name`, unless already done."""
+    if font_name in _REGISTERED_FONTS:
+        return
+    path = os.path.join(fonts_dir, font_name)
+    try:
+        pdfmetrics.registerFont(TTFont(font_name, path))
+    except Exception as e:
+        logger.warning("Failed to register font '%s' from '%s': %s", font_name, path, e)
+        return
+    _REGISTERED_FONTS.add(font_name)
+
+
+def sample_random_fonts_for_style_map(
+    style_map: dict[str, Any],
+    fonts_dir: str,
+    *,
+    seed: Optional[int] = None,
+    rng: Optional[random.Random] = None,
+) -> None:
     """Pick a random font for each per-block style (e.g., title/header/paragraph).
 
     Expects fonts as .ttf files inside `fonts_dir`. Updates style_map in-place.
+    Draws from `rng` if given, else from a private Random(seed); the global RNG is left untouched.
     """
-    if seed is not None:
-        random.seed(seed)
-
-    try:
-        files = os.listdir(fonts_dir)
-    except Exception as e:
-        raise RuntimeError(f"Failed to list fonts_dir={fonts_dir}: {e}")
+    if rng is None:
+        rng = random.Random(seed)
 
-    ttf_paths: list[str] = []
-    for f in files:
-        if not f.lower().endswith(".ttf"):
-            continue
-        p = os.path.join(fonts_dir, f)
-        if os.path.isfile(p) and os.access(p, os.R_OK):
-            ttf_paths.append(f)
-
-    font_names = sorted(set(ttf_paths))
+    font_names = _fonts_dir_scan(fonts_dir).ttf_names
     if not font_names:
         raise RuntimeError(
             f"No readable .ttf fonts found in {fonts_dir}. "
@@ -98,55 +145,137 @@ def sample_random_fonts_for_style_map(style_map: dict[str, Any], fonts_dir: str,
         )
 
     block_keys = [k for k, v in style_map.items() if isinstance(v, dict) and "font_name" in v]
-    picks = random.sample(font_names, k=min(len(block_keys), len(font_names)))
+    picks = rng.sample(font_names, k=min(len(block_keys), len(font_names)))
 
     for i, key in enumerate(block_keys):
         style_map[key]["font_name"] = picks[i % len(picks)]
 
+    # Only fonts that actually get picked are parsed/registered (once per process).
+    for font_name in picks:
+        ensure_font_registered(fonts_dir, font_name)
+
+
+@lru_cache(maxsize=4)
+def _persona_line_offsets(path: str) -> array:
+    """Byte offsets of the non-empty lines of a persona .jsonl file, built once per process.
 
-def sample_persona(path: str, seed: Optional[int] = None) -> str:
+    8 bytes per line instead of the decoded personas; nothing is JSON-parsed here.
+    """
+    offsets = array("q")
+    pos = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                offsets.append(pos)
+            pos += len(line)
+    return offsets
+
+
+def sample_persona(path: str, seed: Optional[int] = None, *, rng: Optional[random.Random] = None) -> str:
     """
     Samples a persona string from a .jsonl file.
     Assumes every line is: {"persona": "..."}.
+    Draws from `rng` if given, else from a private Random(seed); the global RNG is left untouched.
     """
-    if seed is not None:
-        random.seed(seed)
+    if rng is None:
+        rng = random.Random(seed)
 
-    personas: list[str] = []
+    # Pick a line from the cached offset index and decode only that one, instead of
+    # re-reading (and parsing) the whole file on every sample.
+    offsets = _persona_line_offsets(path)
+    if not offsets:
+        raise IndexError(f"No personas in {path}")
 
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            obj: Any = json.loads(line)
-            personas.append(obj["persona"].strip())
+    with open(path, "rb") as f:
+        f.seek(rng.choice(offsets))
+        line = f.readline()
 
-    return random.choice(personas)
+    obj: Any = json.loads(line)
+    return obj["persona"].strip()
 
 
 def get_dir_size_bytes(path: str | os.PathLike) -> int:
     """Recursively compute directory size in bytes."""
+    # scandir + DirEntry instead of os.walk + Path(...).stat(): no Path objects per file, and the
+    # entry type comes from the directory read, so only regular files are stat'ed.
     total = 0
-    p = Path(path)
-    for root, _, files in os.walk(p):
-        for fn in files:
-            fp = Path(root) / fn
-            try:
-                total += fp.stat().st_size
-            except FileNotFoundError:
-                # A file might disappear between walk and stat; ignore.
-                continue
+    stack = [os.fspath(path)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        total += entry.stat().st_size
+                except FileNotFoundError:
+                    # A file might disappear between listing and stat; ignore.
+                    continue
     return total
 
 
-def make_tar_gz(archive_path: str, src_dirs: list[str]) -> str:
-    """Create a .tar.gz archive that contains each directory under its basename."""
+# File bodies are copied into the archive in 2 MiB reads instead of tarfile's default 16 KiB.
+TAR_COPY_BUFSIZE = 2 * 1024 * 1024
+
+
+def _add_dirs_to_tar(tar: tarfile.TarFile, src_dirs: list[str]) -> None:
+    for d in src_dirs:
+        dp = Path(d)
+        if not dp.exists():
+            continue
+        tar.add(str(dp), arcname=dp.name)
+
+
+# Level 1: batches are mostly JPEG pages, which do not compress further, so higher levels
+# spend several times the CPU for a marginally smaller archive.
+GZIP_LEVEL = 1
+
+
+def _gzip_command(threads: Optional[int] = None) -> Optional[list[str]]:
+    """External gzip compressor reading stdin / writing stdout: pigz, else gzip, else None.
+
+    pigz gets `threads` compression threads (default: all cores).
+    """
+    pigz = shutil.which("pigz")
+    if pigz is not None:
+        return [pigz, f"-{GZIP_LEVEL}", "-p", str(threads or os.cpu_count() or 1)]
+    gzip_bin = shutil.which("gzip")
+    if gzip_bin is not None:
+        # Single-threaded, but still compresses in its own process, overlapping with tar's file reads.
+        return [gzip_bin, f"-{GZIP_LEVEL}", "-c"]
+    return None
+
+
+def make_tar_gz(archive_path: str, src_dirs: list[str], threads: Optional[int] = None) -> str:
+    """Create a .tar.gz archive that contains each directory under its basename.
+
+    Tar framing stays in Python (stream mode) and gzip runs in an external pigz/gzip process;
+    only when neither is on PATH does it fall back to tarfile's in-process "w:gz".
+    `threads` caps pigz's compression threads (default: all cores).
+    """
     ap = Path(archive_path)
     ap.parent.mkdir(parents=True, exist_ok=True)
-    with tarfile.open(ap, "w:gz") as tar:
-        for d in src_dirs:
-            dp = Path(d)
-            if not dp.exists():
-                continue
-            tar.add(str(dp), arcname=dp.name)
+
+    cmd = _gzip_command(threads)
+    if cmd is None:
+        with tarfile.open(ap, "w:gz", compresslevel=GZIP_LEVEL, copybufsize=TAR_COPY_BUFSIZE) as tar:
+            _add_dirs_to_tar(tar, src_dirs)
+        return str(ap)
+
+    with open(ap, "wb") as out:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=out)
+        try:
+            with tarfile.open(fileobj=proc.stdin, mode="w|", bufsize=TAR_COPY_BUFSIZE, copybufsize=TAR_COPY_BUFSIZE) as tar:
+                _add_dirs_to_tar(tar, src_dirs)
+        finally:
+            proc.stdin.close()
+            rc = proc.wait()
+    if rc != 0:
+        raise RuntimeError(f"{Path(cmd[0]).name} exited with code {rc} while writing {ap}")
     return str(ap)
 
 
@@ -170,6 +299,10 @@ def get_s3_client(profile: Optional[str], region: Optional[str], endpoint_url: O
             # Disables SigV4 streaming (avoids Content-Encoding: aws-chunked in many cases).
             "payload_signing_enabled": False,
         },
+        # Enough pooled connections for the concurrent multipart paths (16 TransferManager threads,
+        # 8 streaming-part threads) so parts reuse warm keep-alive sockets instead of queueing.
+        max_pool_connections=32,
+        tcp_keepalive=True,
     )
 
     # Extra safety: allow env vars to override behavior consistently across boto3 usage.
@@ -178,6 +311,14 @@ def get_s3_client(profile: Optional[str], region: Optional[str], endpoint_url: O
     return session.client("s3", endpoint_url=endpoint_url, config=cfg)
 
 
+S3_DEFAULT_PART_SIZE = 64 * 1024 * 1024
+
+
+def multipart_part_size(target_bytes: int) -> int:
+    """Part size giving ~64 parts per archive of `target_bytes`, clamped to [16 MiB, 512 MiB]."""
+    return max(16 * 1024 * 1024, min(512 * 1024 * 1024, target_bytes // 64))
+
+
 def upload_file_to_s3(
     local_path: str,
     bucket: str,
@@ -187,16 +328,31 @@ def upload_file_to_s3(
     region: Optional[str] = None,
     endpoint_url: Optional[str] = None,
     max_put_bytes: int = 4_900_000_000,
+    multipart: bool = False,
+    part_size: int = S3_DEFAULT_PART_SIZE,
 ) -> None:
     """Upload a local file to S3 using a single PUT (put_object).
 
     Variant A:
       - Avoid multipart uploads entirely (OBS can store chunked streams incorrectly).
       - Enforce object size < ~5GB.
+
+    With `multipart=True` (only for stores that handle it correctly, e.g. AWS S3) the file goes
+    through boto3's TransferManager instead: concurrent multipart parts, no 5GB cap.
     """
     client = get_s3_client(profile, region, endpoint_url)
 
     lp = Path(local_path)
+    if multipart:
+        cfg = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=16,
+            use_threads=True,
+        )
+        client.upload_file(str(lp), bucket, key, Config=cfg)
+        return
+
     size = lp.stat().st_size
     if size > max_put_bytes:
         raise RuntimeError(
@@ -204,7 +360,8 @@ def upload_file_to_s3(
             f"Reduce --batch_gb (e.g., 4.5) so archives stay under 5GB."
         )
 
-    with open(lp, "rb") as f:
+    # http.client pulls the body in small blocks; a large file buffer turns those into few big reads.
+    with open(lp, "rb", buffering=8 * 1024 * 1024) as f:
         client.put_object(
             Bucket=bucket,
             Key=key,
@@ -213,6 +370,171 @@ def upload_file_to_s3(
         )
 
 
+class S3MultipartWriter(io.RawIOBase):
+    """Write-only file object that streams its bytes to S3 as a multipart upload.
+
+    Full `part_size` parts are uploaded on a thread pool while the producer keeps writing;
+    at most `2 * max_workers` parts (and about `max_buffered_bytes`) are buffered/in flight. `close()` uploads the tail and
+    completes the upload; `abort()` (or leaving a `with` block with an exception) cancels it.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        bucket: str,
+        key: str,
+        *,
+        part_size: int = S3_DEFAULT_PART_SIZE,
+        max_workers: int = 8,
+        max_buffered_bytes: int = 1024 * 1024 * 1024,
+    ):
+        super().__init__()
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._part_size = part_size
+        self._max_in_flight = max(2, min(2 * max_workers, max_buffered_bytes // part_size))
+        self._buf = bytearray()
+        self._parts: list[Future] = []
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+        self.bytes_written = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b: Any) -> int:
+        n = len(b)
+        self._buf += b
+        self.bytes_written += n
+        while len(self._buf) >= self._part_size:
+            self._submit_part(bytes(self._buf[: self._part_size]))
+            del self._buf[: self._part_size]
+        return n
+
+    def _submit_part(self, body: bytes) -> None:
+        part_number = len(self._parts) + 1
+        # Backpressure: wait for the oldest still-running part before buffering another one.
+        running = [f for f in self._parts if not f.done()]
+        if len(running) >= self._max_in_flight:
+            running[0].result()
+        self._parts.append(self._pool.submit(self._upload_part, part_number, body))
+
+    def _upload_part(self, part_number: int, body: bytes) -> dict[str, Any]:
+        resp = self._client.upload_part(
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        return {"ETag": resp["ETag"], "PartNumber": part_number}
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            # The last part may be short (or the only, empty one).
+            if self._buf or not self._parts:
+                self._submit_part(bytes(self._buf))
+                self._buf.clear()
+            parts = [f.result() for f in self._parts]
+            self._client.complete_multipart_upload(
+                Bucket=self._bucket,
+                Key=self._key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self._pool.shutdown(wait=True)
+            super().close()
+
+    def abort(self) -> None:
+        """Cancel the multipart upload; already uploaded parts are discarded by S3."""
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        try:
+            self._client.abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id)
+        except Exception as e:
+            logger.warning("Failed to abort multipart upload s3://%s/%s: %s", self._bucket, self._key, e)
+        super().close()
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def stream_tar_gz_to_s3(
+    src_dirs: list[str],
+    bucket: str,
+    key: str,
+    *,
+    profile: Optional[str] = None,
+    region: Optional[str] = None,
+    endpoint_url: Optional[str] = None,
+    part_size: int = S3_DEFAULT_PART_SIZE,
+    threads: Optional[int] = None,
+) -> int:
+    """Tar+gzip `src_dirs` straight into a multipart upload, without a local archive file.
+
+    Same layout as make_tar_gz (each directory under its basename), same `threads` cap for pigz.
+    Returns the uploaded size.
+    """
+    client = get_s3_client(profile, region, endpoint_url)
+    cmd = _gzip_command(threads)
+    with S3MultipartWriter(client, bucket, key, part_size=part_size) as writer:
+        if cmd is None:
+            with tarfile.open(fileobj=writer, mode="w|gz", bufsize=TAR_COPY_BUFSIZE, copybufsize=TAR_COPY_BUFSIZE) as tar:
+                _add_dirs_to_tar(tar, src_dirs)
+        else:
+            _pipe_tar_through(cmd, src_dirs, writer)
+    return writer.bytes_written
+
+
+def _pipe_tar_through(cmd: list[str], src_dirs: list[str], out: Any) -> None:
+    """tar `src_dirs` | `cmd` (external pigz/gzip), copying the compressed stream into `out`.
+
+    The tar stream is fed from a helper thread so that compression (pigz on all cores) and
+    the part uploads on the calling thread overlap instead of deadlocking on full pipes.
+    """
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    feed_errors: list[BaseException] = []
+
+    def feed() -> None:
+        try:
+            with tarfile.open(fileobj=proc.stdin, mode="w|", bufsize=TAR_COPY_BUFSIZE, copybufsize=TAR_COPY_BUFSIZE) as tar:
+                _add_dirs_to_tar(tar, src_dirs)
+        except BaseException as e:
+            feed_errors.append(e)
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    feeder = threading.Thread(target=feed, name="tar-feeder", daemon=True)
+    feeder.start()
+    try:
+        shutil.copyfileobj(proc.stdout, out, TAR_COPY_BUFSIZE)
+    except BaseException:
+        # Upload side failed: kill the compressor so the feeder's blocked write fails fast.
+        proc.kill()
+        raise
+    finally:
+        feeder.join()
+        proc.stdout.close()
+        rc = proc.wait()
+
+    if feed_errors:
+        raise feed_errors[0]
+    if rc != 0:
+        raise RuntimeError(f"{Path(cmd[0]).name} exited with code {rc} while streaming the archive")
+
+
 def safe_rmtree(path: str) -> None:
     """Remove directory tree if it exists."""
     p = Path(path)
@@ -220,6 +542,16 @@ def safe_rmtree(path: str) -> None:
         shutil.rmtree(p, ignore_errors=True)
 
 
+def safe_rmtree_many(paths: list[str], max_workers: int = 8) -> None:
+    """safe_rmtree() every path, several at a time (unlink-heavy, so threads overlap the syscalls)."""
+    if len(paths) <= 1:
+        for d in paths:
+            safe_rmtree(d)
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as ex:
+        list(ex.map(safe_rmtree, paths))
+
+
 @dataclass
 class GenTask:
     idx: int
@@ -264,8 +596,15 @@ def _worker_loop(
     vllm_host: str,
     vllm_base_port: int,
     samples_dir: str,
+    doc_concurrency: int = 1,
 ) -> None:
-    """One worker pinned to a single GPU via CUDA_VISIBLE_DEVICES."""
+    """One worker pinned to a single GPU via CUDA_VISIBLE_DEVICES.
+
+    Doc tasks are async and up to `doc_concurrency` of them run at once, so the worker's vLLM
+    instance can batch their requests; pic/table tasks run one at a time. Their CPU tail (split,
+    sizes, layout, render, rasterize) is serialized within the worker; main() starts
+    --workers_per_gpu workers per GPU for process-level parallelism.
+    """
     # IMPORTANT: must be set before importing torch/diffusers/etc.
     os.environ["CUDA_VISIBLE_DEVICES"] = str(gpu_id)
 
@@ -354,8 +693,82 @@ def _worker_loop(
         logger.error("[gpu=%s] E2B: failed to create sandbox after %.2fs", gpu_id, time.monotonic() - t_create0)
         raise RuntimeError(f"Failed to create E2B sandbox after retries: {last_err}")
 
-    # Each process must register fonts in its own ReportLab registry.
-    register_fonts(fonts_dir)
+    # Each process has its own ReportLab registry; fonts are registered lazily, on first pick,
+    # by sample_random_fonts_for_style_map, so TTFs that are never sampled are never parsed.
+
+    # Build the persona offset index once up front, so the first task does not pay for the file scan.
+    _persona_line_offsets(personas_path)
+
+    # doc_pipeline is async; keep one loop per worker so the cached AsyncOpenAI client stays bound to it.
+    loop = asyncio.new_event_loop()
+
+    def _put_ok(task: GenTask, out_dir: str, style_map: dict[str, Any]) -> None:
+        sz = get_dir_size_bytes(out_dir)
+        result_q.put({
+            "ok": True,
+            "idx": task.idx,
+            "vllm_base_url": vllm_base_url,
+            "vllm_port": vllm_port,
+            "out_dir": out_dir,
+            "size_bytes": sz,
+            "style_fonts": {
+                "title": style_map["title"]["font_name"],
+                "header": style_map["header"]["font_name"],
+                "paragraph": style_map["paragraph"]["font_name"],
+            },
+        })
+
+    def _put_error(task: GenTask, out_dir: Optional[str]) -> None:
+        # Clean partial outputs if any.
+        if out_dir:
+            safe_rmtree(out_dir)
+        result_q.put({
+            "ok": False,
+            "idx": task.idx,
+            "error": str(sys.exc_info()[1]),
+            "traceback": traceback.format_exc(),
+        })
+
+    async def _run_doc_task(task: GenTask) -> None:
+        out_dir: Optional[str] = None
+        try:
+            # Reported like any other failure, so main() still gets a result for this idx.
+            assert task.pipeline == "doc", f"non-doc task {task.pipeline!r} in the doc window"
+            # Tasks interleave on this loop, so everything they sample comes from their own Random.
+            rng = random.Random(task.seed)
+            style_map = build_style_map(rng)
+
+            sample_random_fonts_for_style_map(style_map, fonts_dir, rng=rng)
+            sampled_persona = sample_persona(personas_path, rng=rng)
+
+            out_dir = await doc_pipeline(sampled_persona, style_map, out_path = samples_root, base_url=f"{vllm_base_url}/v1", rng=rng)
+            _put_ok(task, out_dir, style_map)
+        except Exception:
+            _put_error(task, out_dir)
+
+    async def _run_doc_tasks(first: GenTask) -> bool:
+        """Sliding window of doc tasks: refill from the queue as runs finish.
+
+        Returns True once the stop sentinel has been taken from the queue.
+        """
+        in_flight: set[asyncio.Task] = set()
+        pending: Optional[GenTask] = first
+        stop = False
+        while True:
+            while not stop and len(in_flight) < doc_concurrency:
+                if pending is None:
+                    try:
+                        pending = task_q.get_nowait()
+                    except Empty:
+                        break
+                    if pending is None:
+                        stop = True
+                        break
+                in_flight.add(asyncio.ensure_future(_run_doc_task(pending)))
+                pending = None
+            if not in_flight:
+                return stop
+            _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
 
     while True:
         try:
@@ -365,20 +778,25 @@ def _worker_loop(
 
         if task is None:
             _close_sbx()
+            loop.close()
             return
 
+        if task.pipeline == "doc":
+            if loop.run_until_complete(_run_doc_tasks(task)):
+                _close_sbx()
+                loop.close()
+                return
+            continue
+
         out_dir: Optional[str] = None
         try:
             rng = random.Random(task.seed)
             style_map = build_style_map(rng)
 
-            sample_random_fonts_for_style_map(style_map, fonts_dir, seed=task.seed)
-            sampled_persona = sample_persona(personas_path, seed=task.seed)
+            sample_random_fonts_for_style_map(style_map, fonts_dir, rng=rng)
+            sampled_persona = sample_persona(personas_path, rng=rng)
 
-            if task.pipeline == "doc":
-                out_dir = doc_pipeline(sampled_persona, style_map, out_path = samples_root, base_url=f"{vllm_base_url}/v1")
-
-            elif task.pipeline == "pic":
+            if task.pipeline == "pic":
                 t_sbx0 = time.monotonic()
                 _ensure_sbx()
                 logger.info("[gpu=%s idx=%s] E2B: ensure sandbox OK in %.2fs", gpu_id, task.idx, time.monotonic() - t_sbx0)
@@ -438,6 +856,7 @@ def _worker_loop(
                         out_path = samples_root,
                         base_url=f"{vllm_base_url}/v1",
                         sbx=sbx,
+                        rng=rng,
                     )
                     logger.info("[gpu=%s idx=%s] pic_pipeline: done in %.2fs", gpu_id, task.idx, time.monotonic() - t_pic0)
                 except Exception as e:
@@ -474,6 +893,7 @@ def _worker_loop(
                             out_path = samples_root,
                             base_url=f"{vllm_base_url}/v1",
                             sbx=sbx,
+                            rng=rng,
                         )
                         logger.info("[gpu=%s idx=%s] pic_pipeline: retry done in %.2fs", gpu_id, task.idx, time.monotonic() - t_pic1)
                         
@@ -492,6 +912,7 @@ def _worker_loop(
                             out_path = samples_root,
                             base_url=f"{vllm_base_url}/v1",
                             sbx=sbx,
+                            rng=rng,
                         )
                         logger.info("[gpu=%s idx=%s] pic_pipeline: retry after recreate done in %.2fs", gpu_id, task.idx, time.monotonic() - t_pic1)
 
@@ -506,6 +927,7 @@ def _worker_loop(
                             out_path = samples_root,
                             base_url=f"{vllm_base_url}/v1",
                             sbx=sbx,
+                            rng=rng,
                         )
                         logger.info("[gpu=%s idx=%s] pic_pipeline: retry done", gpu_id, task.idx, time.monotonic() - t_pic1)
 
@@ -525,6 +947,7 @@ def _worker_loop(
                         out_path = samples_root,
                         base_url=f"{vllm_base_url}/v1",
                         sbx=sbx,
+                        rng=rng,
                     )
                     logger.info("[gpu=%s idx=%s] table_pipeline: done in %.2fs", gpu_id, task.idx, time.monotonic() - t_pic0)
                 except Exception as e:
@@ -558,6 +981,7 @@ def _worker_loop(
                             out_path = samples_root,
                             base_url=f"{vllm_base_url}/v1",
                             sbx=sbx,
+                            rng=rng,
                         )
                         logger.info("[gpu=%s idx=%s] table_pipeline: retry done in %.2fs", gpu_id, task.idx, time.monotonic() - t_pic1)
                         
@@ -574,6 +998,7 @@ def _worker_loop(
                             out_path = samples_root,
                             base_url=f"{vllm_base_url}/v1",
                             sbx=sbx,
+                            rng=rng,
                         )
                         logger.info("[gpu=%s idx=%s] table_pipeline: retry after recreate done in %.2fs", gpu_id, task.idx, time.monotonic() - t_pic1)
 
@@ -586,6 +1011,7 @@ def _worker_loop(
                             out_path = samples_root,
                             base_url=f"{vllm_base_url}/v1",
                             sbx=sbx,
+                            rng=rng,
                         )
                         logger.info("[gpu=%s idx=%s] table_pipeline: retry done in %.2fs", gpu_id, task.idx, time.monotonic() - t_pic1)
 
@@ -593,30 +1019,9 @@ def _worker_loop(
                         raise
             
 
-            sz = get_dir_size_bytes(out_dir)
-            result_q.put({
-                "ok": True,
-                "idx": task.idx,
-                "vllm_base_url": vllm_base_url,
-                "vllm_port": vllm_port,
-                "out_dir": out_dir,
-                "size_bytes": sz,
-                "style_fonts": {
-                    "title": style_map["title"]["font_name"],
-                    "header": style_map["header"]["font_name"],
-                    "paragraph": style_map["paragraph"]["font_name"],
-                },
-            })
-        except Exception as e:
-            # Clean partial outputs if any.
-            if out_dir:
-                safe_rmtree(out_dir)
-            result_q.put({
-                "ok": False,
-                "idx": task.idx,
-                "error": str(e),
-                "traceback": traceback.format_exc(),
-            })
+            _put_ok(task, out_dir, style_map)
+        except Exception:
+            _put_error(task, out_dir)
 
 
 def main() -> None:
@@ -704,7 +1109,28 @@ def main() -> None:
         default=None,
         help="Optional S3 endpoint URL for S3-compatible storages.",
     )
+    parser.add_argument(
+        "--s3_multipart",
+        action="store_true",
+        help="Stream archives to S3 as concurrent multipart uploads (no local archive, no 5GB limit). Leave off for OBS, which needs single PUTs.",
+    )
+    parser.add_argument(
+        "--doc_concurrency",
+        type=int,
+        default=16,
+        help="Doc pipeline only: how many samples each worker keeps in flight against its vLLM instance.",
+    )
+    parser.add_argument(
+        "--workers_per_gpu",
+        type=int,
+        default=1,
+        help="Worker processes per GPU/vLLM instance. A worker builds, renders and rasterizes one page at a time, so raise this when the CPU tail (not vLLM) is the bottleneck.",
+    )
     args = parser.parse_args()
+    if args.doc_concurrency < 1:
+        parser.error("--doc_concurrency must be >= 1")
+    if args.workers_per_gpu < 1:
+        parser.error("--workers_per_gpu must be >= 1")
 
     out_root = Path(args.out_root)
     samples_root = out_root / "samples"
@@ -723,28 +1149,78 @@ def main() -> None:
         args.out_root,
     )
 
+    if args.s3_bucket:
+        # Resolve credentials, DNS and TLS now instead of on the first batch's upload.
+        # A failure here (e.g. HeadBucket not permitted on the store) is not fatal.
+        try:
+            get_s3_client(args.aws_profile, args.aws_region, args.s3_endpoint).head_bucket(Bucket=args.s3_bucket)
+        except Exception as e:
+            logger.warning("S3 pre-warm (head_bucket on %r) failed: %s", args.s3_bucket, e)
+
     # Batching state
     target_bytes = int(args.batch_gb * 1024 * 1024 * 1024)
+    part_size = multipart_part_size(target_bytes)
     batch_dirs: list[str] = []
     batch_bytes = 0
     batch_idx = 0
 
-    def flush_batch() -> None:
-        nonlocal batch_dirs, batch_bytes, batch_idx
-        if not batch_dirs:
-            return
+    # Archiving + upload of finished batches runs on background threads, so result collection
+    # continues meanwhile. Two slots let one batch compress while the previous one uploads;
+    # at most MAX_PENDING_FLUSHES batches are in flight (bounds the extra disk usage).
+    MAX_PENDING_FLUSHES = 2
+    # Concurrent archives split the cores between them instead of each starting pigz on all of them.
+    archive_threads = max(1, (os.cpu_count() or 1) // MAX_PENDING_FLUSHES)
+    archiver = ThreadPoolExecutor(max_workers=MAX_PENDING_FLUSHES)
+    pending_flushes: deque[Future] = deque()
 
+    def archive_and_upload(dirs: list[str], nbytes: int, idx: int) -> None:
         ts = time.strftime("%Y%m%d_%H%M%S")
-        archive_name = f"batch_{batch_idx:05d}_{ts}_{uuid.uuid4().hex}.tar.gz"
+        archive_name = f"batch_{idx:05d}_{ts}_{uuid.uuid4().hex}.tar.gz"
         archive_path = str(archives_root / archive_name)
 
+        prefix = args.s3_prefix.strip("/")
+        s3_key = f"{prefix}/{archive_name}" if prefix else archive_name
+
+        if args.s3_bucket and args.s3_multipart:
+            # Stream tar.gz into the multipart upload: no local archive is written and read back.
+            logger.info(
+                "Streaming %d sample dirs (~%.2f GB) -> s3://%s/%s",
+                len(dirs),
+                nbytes / (1024**3),
+                args.s3_bucket,
+                s3_key,
+            )
+            try:
+                sent = stream_tar_gz_to_s3(
+                    dirs,
+                    args.s3_bucket,
+                    s3_key,
+                    profile=args.aws_profile,
+                    region=args.aws_region,
+                    endpoint_url=args.s3_endpoint,
+                    part_size=part_size,
+                    threads=archive_threads,
+                )
+                logger.info("Upload OK (%.2f GB streamed).", sent / (1024**3))
+                safe_rmtree_many(dirs)
+                logger.info("Batch uploaded and local sample dirs removed.")
+                return
+            except Exception as e:
+                logger.error(
+                    "Streaming upload FAILED for s3://%s/%s. Error: %s. Falling back to a local archive.",
+                    args.s3_bucket,
+                    s3_key,
+                    e,
+                )
+                logger.error("Traceback:\n%s", traceback.format_exc())
+
         logger.info(
             "Archiving %d sample dirs (~%.2f GB) -> %s",
-            len(batch_dirs),
-            batch_bytes / (1024**3),
+            len(dirs),
+            nbytes / (1024**3),
             archive_path,
         )
-        make_tar_gz(archive_path, batch_dirs)
+        make_tar_gz(archive_path, dirs, threads=archive_threads)
 
         # Log actual archive size (can differ from folder size).
         archive_size = Path(archive_path).stat().st_size
@@ -754,12 +1230,9 @@ def main() -> None:
             (archive_size / (1024**3)) if archive_size >= 0 else float('nan'),
         )
 
-        prefix = args.s3_prefix.strip("/")
-        s3_key = f"{prefix}/{archive_name}" if prefix else archive_name
         if not args.s3_bucket:
             # Upload disabled: keep archive locally, but remove sample dirs.
-            for d in batch_dirs:
-                safe_rmtree(d)
+            safe_rmtree_many(dirs)
             logger.info("Upload disabled. Kept local archive: %s", archive_path)
         else:
             logger.info("Uploading to s3://%s/%s", args.s3_bucket, s3_key)
@@ -772,14 +1245,15 @@ def main() -> None:
                     region=args.aws_region,
                     endpoint_url=args.s3_endpoint,
                     max_put_bytes=4_900_000_000,
+                    multipart=args.s3_multipart,
+                    part_size=part_size,
                 )
                 # After successful upload, delete local archive
                 os.remove(archive_path)
                 logger.info("Upload OK. Removed local archive: %s", archive_path)
 
                 # Only after a successful upload remove sample dirs.
-                for d in batch_dirs:
-                    safe_rmtree(d)
+                safe_rmtree_many(dirs)
                 logger.info("Batch uploaded and local sample dirs removed.")
             except Exception as e:
                 logger.error(
@@ -790,10 +1264,17 @@ def main() -> None:
                     e,
                 )
                 logger.error("Traceback:\n%s", traceback.format_exc())
-                for d in batch_dirs:
-                    safe_rmtree(d)
+                safe_rmtree_many(dirs)
                 logger.info("Local sample dirs removed after the error.")
-                return
+
+    def flush_batch() -> None:
+        nonlocal batch_dirs, batch_bytes, batch_idx
+        if not batch_dirs:
+            return
+
+        while len(pending_flushes) >= MAX_PENDING_FLUSHES:
+            pending_flushes.popleft().result()
+        pending_flushes.append(archiver.submit(archive_and_upload, batch_dirs, batch_bytes, batch_idx))
 
         batch_dirs = []
         batch_bytes = 0
@@ -802,17 +1283,19 @@ def main() -> None:
 
     # Generate samples in parallel (multi-GPU)
     n_total = int(args.n_samples)
-    n_workers = args.num_gpus
+    # Several processes may share one GPU's vLLM instance; each has its own ReportLab/PyMuPDF state.
+    n_workers = args.num_gpus * args.workers_per_gpu
 
     ctx = mp.get_context("spawn")
     task_q: mp.Queue = ctx.Queue()
     result_q: mp.Queue = ctx.Queue()
 
     workers: list[mp.Process] = []
-    for gpu_id in range(n_workers):
+    for worker_idx in range(n_workers):
+        gpu_id = worker_idx // args.workers_per_gpu
         p = ctx.Process(
             target=_worker_loop,
-            args=(gpu_id, task_q, result_q, fonts_dir, personas_path, args.vllm_host, args.vllm_base_port, str(samples_root)),
+            args=(gpu_id, task_q, result_q, fonts_dir, personas_path, args.vllm_host, args.vllm_base_port, str(samples_root), args.doc_concurrency),
             daemon=True,
         )
         p.start()
@@ -859,8 +1342,6 @@ def main() -> None:
             sz = int(res["size_bytes"])
             fonts = res.get("style_fonts", {})
 
-            sz = get_dir_size_bytes(out_dir)
-
             # logger.info(
             #     "Generated %d/%d: %s (%.2f MB). Fonts: title=%s header=%s paragraph=%s vLLM=%s",
             #     res.get("idx", 0) + 1,
@@ -877,6 +1358,8 @@ def main() -> None:
             batch_bytes += sz
 
             # logger.info("Current batch: %.2f GB (target %.2f GB).", batch_bytes / (1024**3), target_bytes / (1024**3))
+            # Batch fill shown on the progress bar instead; refresh=False defers it to the next bar redraw.
+            pbar.set_postfix(batch_gb=f"{batch_bytes / (1024**3):.2f}", refresh=False)
 
             if batch_bytes >= target_bytes:
                 flush_batch()
@@ -889,6 +1372,9 @@ def main() -> None:
 
     # Flush remaining
     flush_batch()
+    while pending_flushes:
+        pending_flushes.popleft().result()
+    archiver.shutdown(wait=True)
 
 
 if __name__ == "__main__":
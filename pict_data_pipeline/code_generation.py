@@ -2,27 +2,20 @@ import os
 import re
 import io
 import base64
-from openai import OpenAI
-from functools import lru_cache
+
+from utils.openai_clients import get_openai_client
 from e2b_code_interpreter import Sandbox
 
 _B64_RE = re.compile(r"^BYTES_B64:([A-Za-z0-9+/=]+)\s*$")
 
+# Static instructions first, persona/topic/data last (shared prefix for vLLM's automatic prefix caching).
 GENERATE_CHART_CODE_MATPLOTLIB_PROMPT = """You are an expert Python data analyst who writes clean, executable `matplotlib` code.
 
-My persona is: "{persona}"
-I have data about {topic} to visualize as a {figure_type}.
-
-I will provide the data as a **JSON file**.  
+I will provide the data as a **JSON file** (at the end, after my persona and the topic).  
 Your code must **extract all data from this JSON and load it into a single variable named `df` of type `pd.DataFrame`**.  
 **All extracted data must be explicitly assigned to `df` in the code.**  
 This `df` variable will then be used throughout the rest of the code.
 
-Here is the JSON data:
-<data>
-{data}
-</data>
-
 Your task:
 - Output **only executable Python code**.
 - The code must generate the requested chart using `matplotlib`.
@@ -58,20 +51,20 @@ Requirements:
    - Do not include explanations, comments outside the code, or any extra text.
    - Do not include example usage.
    - The response must consist of a **single Python code block only**, starting with ```python and ending with ```.
-"""
 
+My persona is: "{persona}"
+I have data about {topic} to visualize as a {figure_type}.
 
-@lru_cache(maxsize=32)
-def _get_openai_client(base_url: str) -> OpenAI:
-    return OpenAI(
-        base_url=base_url,
-        api_key="EMPTY",
-    )
+Here is the JSON data:
+<data>
+{data}
+</data>
+"""
 
 
 def generate_code(persona: str, topic: str, model: str, data: str, figure_type: str, base_url: str) -> str:
     
-    client = _get_openai_client(base_url)
+    client = get_openai_client(base_url)
 
     prompt = GENERATE_CHART_CODE_MATPLOTLIB_PROMPT.format(persona=persona, topic=topic, data=data, figure_type=figure_type)
 
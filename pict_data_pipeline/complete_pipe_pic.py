@@ -6,8 +6,7 @@ from pathlib import Path
 from datetime import datetime, timezone
 import uuid
 from PIL import Image
-import fitz
-import os
+import random
 
 from pict_data_pipeline.topic_generation import generate_topic
 from pict_data_pipeline.data_generation import generate_data
@@ -17,25 +16,21 @@ from pict_data_pipeline.text_split_with_image import split_to_blocks
 from pict_data_pipeline.layout_generation_with_image import generate_layout
 from utils.generate_json_with_sizes import generate_json_with_sizes
 from utils.render_ans import render_blocks_json_to_pdf
+from utils.pipeline_io import PIPELINE_DEBUG, render_first_page, write_json
 
 
 logger = logging.getLogger(__name__)
 
-
-def save_jpeg(pdf_path: str, out_jpeg_path: str, dpi: int = 300, quality: int = 70) -> Optional[str]:
-    """Render the first page of a PDF to JPEG with compression.
+def save_jpeg(pdf: str | bytes, out_jpeg_path: str, dpi: int = 300, quality: int = 70) -> Optional[str]:
+    """Render the first page of a PDF (a path or the PDF bytes) to JPEG with compression.
 
     Tries PyMuPDF (fitz) first, then pdf2image if available.
     Returns the output path on success, otherwise None.
     """
 
-    doc = fitz.open(pdf_path)
-    page = doc.load_page(0)
-    mat = fitz.Matrix(dpi / 72.0, dpi / 72.0)
-    pix = page.get_pixmap(matrix=mat, alpha=False)
+    pix = render_first_page(pdf, dpi)
     img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
     img.save(out_jpeg_path, format="JPEG", quality=int(quality), optimize=True, progressive=True)
-    doc.close()
     return out_jpeg_path
 
 
@@ -55,7 +50,8 @@ def make_next_run_dir(OUT_ROOT : Path) -> Path:
 
 
 def pic_pipeline(sampled_persona: str, figure_type: str, style_map: Dict[str, Dict[str, float]], 
-                out_path : str | Path, base_url: str, sbx: Any | None = None) -> Path:
+                out_path : str | Path, base_url: str, sbx: Any | None = None, debug: bool = PIPELINE_DEBUG,
+                rng: Optional[random.Random] = None) -> Path:
 
     MODEL = "Qwen/Qwen2.5-14B-Instruct"
 
@@ -94,7 +90,7 @@ def pic_pipeline(sampled_persona: str, figure_type: str, style_map: Dict[str, Di
 
     picture = save_generated_image(code, sbx=sbx)
 
-    split_json = split_to_blocks(text=text, figure_type=figure_type)
+    split_json = split_to_blocks(text=text, figure_type=figure_type, rng=rng)
     # Put the generated data into the figure block content
     figure_payload = json.dumps(data, ensure_ascii=False)
     for b in split_json.get("blocks", []):
@@ -102,36 +98,34 @@ def pic_pipeline(sampled_persona: str, figure_type: str, style_map: Dict[str, Di
             b["content"] = figure_payload
             break
         
-    out_path = f"{str(run_dir)}/split.json"
-    # with open(out_path, "w", encoding="utf-8") as f:
-    #     json.dump(split_json, f, ensure_ascii=False, indent=2)
-    # logger.info("Split saved to: %s", out_path)
+    if debug:
+        out_path = f"{str(run_dir)}/split.json"
+        write_json(out_path, split_json)
+        logger.info("Split saved to: %s", out_path)
 
-    json_with_bbox_sizes = generate_json_with_sizes(split_json, style_map=style_map, picture=picture)
-    # out_path = f"{str(run_dir)}/json_with_bbox_sizes.json"
-    # with open(out_path, "w", encoding="utf-8") as f:
-    #     json.dump(json_with_bbox_sizes, f, ensure_ascii=False, indent=2)
-    # logger.info("json_with_bbox_sizes saved to: %s", out_path)
+    json_with_bbox_sizes = generate_json_with_sizes(split_json, style_map=style_map, picture=picture, rng=rng)
+    if debug:
+        out_path = f"{str(run_dir)}/json_with_bbox_sizes.json"
+        write_json(out_path, json_with_bbox_sizes)
+        logger.info("json_with_bbox_sizes saved to: %s", out_path)
 
     final_layout = generate_layout(data = json_with_bbox_sizes, style_map=style_map)
     out_path = f"{str(run_dir)}/ans.json"
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(final_layout, f, ensure_ascii=False, indent=2)
+    write_json(out_path, final_layout)
     # logger.info("Layout saved to: %s", out_path)
 
-    pdf_path = render_blocks_json_to_pdf(
-        f"{str(run_dir)}/ans.json",
-        out_pdf_path=f"{str(run_dir)}/out.pdf",
+    # The PDF is only an intermediate for the JPEG: render it in memory instead of out.pdf + os.remove.
+    pdf_bytes = render_blocks_json_to_pdf(
+        None,
+        out_pdf_path=None,
         draw_frames=False,
         draw_word_bboxes=False,
         style_map=style_map,
-        picture=picture
+        picture=picture,
+        data=final_layout,
     )
-    # logger.info("Render saved to: %s", pdf_path)
 
     jpeg_path = f"{str(run_dir)}/out.jpg"
-    saved_jpeg = save_jpeg(str(pdf_path), jpeg_path, dpi=300, quality=70)
-    
-    os.remove(pdf_path)
+    saved_jpeg = save_jpeg(pdf_bytes, jpeg_path, dpi=300, quality=70)
 
     return run_dir
\ No newline at end of file
@@ -1,8 +1,8 @@
 import os
 import json
 from typing import Any, Dict
-from openai import OpenAI
-from functools import lru_cache
+
+from utils.openai_clients import get_openai_client
 
 
 GENERATE_DOCUMENT_DATA_JSON_PROMPT = """You are an expert in data analysis and have broad knowledge about various topics.
@@ -18,17 +18,9 @@ Here are the requirements:
 6. All data must be in Russian, even if the persona is non-Russian."""
 
 
-@lru_cache(maxsize=32)
-def _get_openai_client(base_url: str) -> OpenAI:
-    return OpenAI(
-        base_url=base_url,
-        api_key="EMPTY",
-    )
-
-
 def generate_data(persona: str, topic: str, model: str, figure_type: str, base_url: str) -> str:
     
-    client = _get_openai_client(base_url)
+    client = get_openai_client(base_url)
 
     prompt = GENERATE_DOCUMENT_DATA_JSON_PROMPT.format(persona=persona, topic=topic, figure_type=figure_type)
 
@@ -40,8 +32,15 @@ def generate_data(persona: str, topic: str, model: str, figure_type: str, base_u
         ],
         temperature=0.7,
         max_tokens=2000,
+        # vLLM constrains decoding to a JSON object, so the reply carries no stray prose around it.
+        response_format={"type": "json_object"},
     )
 
-    text = (completion.choices[0].message.content or "").strip()
-    obj: Dict[str, Any] = json.loads(text)
+    choice = completion.choices[0]
+    # Constrained decoding does not help if the object is cut off at max_tokens.
+    if choice.finish_reason == "length":
+        raise ValueError("Generated data was truncated at max_tokens=2000; the JSON object is incomplete.")
+
+    # json.loads skips surrounding whitespace itself; no need for a stripped copy first.
+    obj: Dict[str, Any] = json.loads(choice.message.content or "")
     return obj["data"]
\ No newline at end of file
@@ -1,19 +1,14 @@
 import os
+import re
 import json
 from typing import Any, Dict
-from openai import OpenAI
-from functools import lru_cache
 
+from utils.openai_clients import get_openai_client
 
-GENERATE_DOCUMENT_TEXT_JSON_PROMPT = """You are an expert writer.
-You are given:
-- a persona: "{persona}"
-- structured data describing the topic: {topic} (referred to as "data")
 
-Here is the data in JSON format:
-<data>
-{data}
-</data>
+# Static instructions first, persona/topic/data last (shared prefix for vLLM's automatic prefix caching).
+GENERATE_DOCUMENT_TEXT_JSON_PROMPT = """You are an expert writer.
+You are given (at the end) a persona and structured data describing a topic (referred to as "data").
 
 Your task is to generate a realistic, coherent, single-page document text based strictly on the provided data and adapted to the given persona. 
 Do not invent facts that contradict the data; use the data as the factual backbone and expand it into natural language where appropriate.
@@ -26,15 +21,24 @@ Here are the requirements:
 4. The output must be written entirely in Russian, even if the persona is non-Russian.
 5. Structure requirements:
 - Start with a clear TITLE on the first line (1 sentence, no bullet/numbering).
-- Do NOT use asterisks for emphasis or formatting. Use plain text only."""
+- Do NOT use asterisks for emphasis or formatting. Use plain text only.
 
+Persona: "{persona}"
+Topic: {topic}
 
-@lru_cache(maxsize=32)
-def _get_openai_client(base_url: str) -> OpenAI:
-    return OpenAI(
-        base_url=base_url,
-        api_key="EMPTY",
-    )
+Here is the data in JSON format:
+<data>
+{data}
+</data>"""
+
+
+
+# Word characters that are not digits/underscore and not basic Latin or Cyrillic:
+#   Cyrillic U+0400-04FF, Supplement U+0500-052F, Extended-A U+2DE0-2DFF,
+#   Extended-B U+A640-A69F, Extended-C U+1C80-1C8F.
+_NON_LATIN_CYRILLIC_CANDIDATE_RE = re.compile(
+    r"[^\W\d_A-Za-z\u0400-\u052F\u2DE0-\u2DFF\uA640-\uA69F\u1C80-\u1C8F]"
+)
 
 
 def _contains_non_latin_or_cyrillic_letters(text: str) -> bool:
@@ -49,26 +53,18 @@ def _contains_non_latin_or_cyrillic_letters(text: str) -> bool:
     if not text:
         return False
 
-    for ch in text:
-        if ch.isalpha():
-            code = ord(ch)
-            is_basic_latin = (0x0041 <= code <= 0x005A) or (0x0061 <= code <= 0x007A)
-            is_cyrillic = (
-                (0x0400 <= code <= 0x04FF)  # Cyrillic
-                or (0x0500 <= code <= 0x052F)  # Cyrillic Supplement
-                or (0x2DE0 <= code <= 0x2DFF)  # Cyrillic Extended-A
-                or (0xA640 <= code <= 0xA69F)  # Cyrillic Extended-B
-                or (0x1C80 <= code <= 0x1C8F)  # Cyrillic Extended-C
-            )
-            if not (is_basic_latin or is_cyrillic):
-                return True
+    # The C-level regex scan skips the (typical) all-allowed text in one pass; the rare candidates
+    # it yields are confirmed with str.isalpha() to keep the exact "alphabetic letter" semantics.
+    for m in _NON_LATIN_CYRILLIC_CANDIDATE_RE.finditer(text):
+        if m.group().isalpha():
+            return True
 
     return False
 
 
 def generate_text(persona: str, topic: str, model: str, data: str, base_url: str) -> str:
     
-    client = _get_openai_client(base_url)
+    client = get_openai_client(base_url)
 
     prompt = GENERATE_DOCUMENT_TEXT_JSON_PROMPT.format(persona=persona, topic=topic, data=data)
 
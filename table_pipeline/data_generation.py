@@ -1,8 +1,8 @@
 import os
 import json
 from typing import Any, Dict
-from openai import OpenAI
-from functools import lru_cache
+
+from utils.openai_clients import get_openai_client
 import pandas as pd
 
 
@@ -20,17 +20,9 @@ Here are the requirements:
 6. All data must be in Russian, even if the persona is non-Russian."""
 
 
-@lru_cache(maxsize=32)
-def _get_openai_client(base_url: str) -> OpenAI:
-    return OpenAI(
-        base_url=base_url,
-        api_key="EMPTY",
-    )
-
-
 def generate_data(persona: str, topic: str, model: str, base_url: str) -> str:
     
-    client = _get_openai_client(base_url)
+    client = get_openai_client(base_url)
 
     prompt = GENERATE_DOCUMENT_DATA_JSON_PROMPT.format(persona=persona, topic=topic)
 
@@ -1,6 +1,7 @@
 import os
-from openai import OpenAI
-from functools import lru_cache
+
+from utils.openai_clients import get_openai_client
+from utils.llm_cache import cache_get, cache_key, cache_set
 
 GENERATE_DOCUMENT_TOPIC_PROMPT = """You are an expert in data analysis and have a broad knowledge of different topics.
 My persona is: "{persona}"
@@ -12,30 +13,32 @@ Here are the requirements:
 3. The topic is conditioned on the table type.
 4. The topics must be in Russian, even if the persona is non-Russian."""
 
-
-@lru_cache(maxsize=32)
-def _get_openai_client(base_url: str) -> OpenAI:
-    return OpenAI(
-        base_url=base_url,
-        api_key="EMPTY",
-    )
+TOPIC_SYSTEM_PROMPT = "Return ONLY the topic string in Russian. No quotes, no extra text."
+TOPIC_TEMPERATURE = 0.5
 
 
 def generate_topic(persona: str, model: str, base_url: str) -> str:
 
-    client = _get_openai_client(base_url)
+    client = get_openai_client(base_url)
 
     prompt = GENERATE_DOCUMENT_TOPIC_PROMPT.format(persona=persona)
 
+    key = cache_key(model, TOPIC_SYSTEM_PROMPT, prompt, TOPIC_TEMPERATURE)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached
+
     completion = client.chat.completions.create(
         model=model,
         messages=[
-            {"role": "system", "content": "Return ONLY the topic string in Russian. No quotes, no extra text."},
+            {"role": "system", "content": TOPIC_SYSTEM_PROMPT},
             {"role": "user", "content": prompt},
         ],
-        temperature=0.5,
+        temperature=TOPIC_TEMPERATURE,
         max_tokens=200,
     )
 
     content = completion.choices[0].message.content
-    return content.replace("\n", "").replace("\r", "").strip()
\ No newline at end of file
+    topic = content.replace("\n", "").replace("\r", "").strip()
+    cache_set(key, topic)
+    return topic
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import List, Tuple
 from reportlab.pdfbase import pdfmetrics
 import math
@@ -16,6 +17,12 @@ def string_width_px(s: str, font_name: str, font_size_pt: float, dpi: int) -> fl
     return pt_to_px(w_pt, dpi)
 
 
+@lru_cache(maxsize=256)
+def space_width_pt(font_name: str, font_size_pt: float) -> float:
+    """Width of a single space in points; cached, since blocks share a handful of (font, size) styles."""
+    return float(pdfmetrics.stringWidth(" ", font_name, font_size_pt))
+
+
 def wrap_text_to_lines(
     text: str,
     max_text_width_px: int,
@@ -74,12 +81,14 @@ def wrap_text_to_lines(
     return lines
 
 
+@lru_cache(maxsize=256)
 def get_font_vmetrics_pt(font_name: str, font_size_pt: float) -> tuple[float, float, float]:
     """Return (ascent_pt, descent_pt, line_h_pt) using conservative metrics.
 
     Some fonts underreport ascent/descent via getAscent/getDescent.
     If the font face provides a bbox (llx,lly,urx,ury) in 1/1000 em, we use it
     to widen ascent/descent so we never underestimate line height.
+    Cached per (font, size): it is called for every word and every block.
     """
     asc = float(pdfmetrics.getAscent(font_name, font_size_pt))
     desc = float(pdfmetrics.getDescent(font_name, font_size_pt)) 
@@ -101,6 +110,7 @@ def get_font_vmetrics_pt(font_name: str, font_size_pt: float) -> tuple[float, fl
     return asc, desc, line_h
 
 
+@lru_cache(maxsize=256)
 def get_font_vmetrics_tight_pt(font_name: str, font_size_pt: float) -> tuple[float, float, float]:
     """Return (ascent_pt, descent_pt, line_h_pt) using tighter metrics.
 
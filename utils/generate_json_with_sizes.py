@@ -3,7 +3,6 @@ import random
 from typing import Any, Dict, List, Optional
 from PIL import Image
 import io
-import re
 
 from .count_bbox_size import measure_bbox_size_for_block, measure_bbox_size_for_one_word
 
@@ -14,8 +13,12 @@ def split_lines_to_tokens(
     out = []
     for i, line in enumerate(lines):
         if line:
-            for t in re.findall(r"\n|[^\s]+", line):
-                if t != "":
+            # Same tokens as re.findall(r"\n|[^\s]+", line), but via C-level str.split:
+            # regex \s and str.split() share the same Unicode whitespace definition.
+            for j, part in enumerate(line.split("\n")):
+                if j:
+                    out.append({"content": "\n"})
+                for t in part.split():
                     out.append({"content": t})
 
         # Every boundary between returned lines becomes a newline token.
@@ -29,6 +32,7 @@ def generate_json_with_sizes(
     layout_json: str | Dict[str, Any],
     style_map: Dict[str, Any] = None,
     picture: io.BytesIO | None = None,
+    rng: Optional[random.Random] = None,
 ) -> Dict[str, Any]:
     """
     Input JSON:
@@ -44,6 +48,7 @@ def generate_json_with_sizes(
     Note: max_width_px is chosen per-block based on a random split boundary:
       - blocks before split get max_width_px=2080
       - blocks after split get max_width_px=1040
+    The split and title widths are drawn from `rng` (the global `random` module if None).
     """
     if isinstance(layout_json, str):
         obj: Dict[str, Any] = json.loads(layout_json)
@@ -51,6 +56,7 @@ def generate_json_with_sizes(
         obj = layout_json
 
     style_map = style_map
+    rng = rng or random
     lines = []
     out_blocks = []
 
@@ -58,7 +64,7 @@ def generate_json_with_sizes(
     if n_blocks <= 1:
         split_idx = n_blocks
     else:
-        split_idx = random.randint(0, n_blocks)
+        split_idx = rng.randint(0, n_blocks)
 
     for i, b in enumerate(obj["blocks"]):
         b_type = b.get("type")
@@ -80,7 +86,7 @@ def generate_json_with_sizes(
             leading_pt = float(style["leading"])
 
             if b_type == "title":
-                max_width_px = random.choice([2080, 1040])
+                max_width_px = rng.choice([2080, 1040])
             else:
                 if i < split_idx:
                     max_width_px = 2080
@@ -110,10 +116,8 @@ def generate_json_with_sizes(
                 if not isinstance(tok, str):
                     continue
 
-                out_wd = dict(wd)
                 if tok == "\n":
-                    out_wd["bbox_size"] = [0, 0]
-                    words_out.append(out_wd)
+                    words_out.append({"content": "\n", "bbox_size": (0, 0)})
                     continue
 
                 ww, wh = measure_bbox_size_for_one_word(
@@ -122,8 +126,9 @@ def generate_json_with_sizes(
                     font_size_pt=font_size_pt,
                     dpi=dpi,
                 )
-                out_wd["bbox_size"] = [int(ww), int(wh)]
-                words_out.append(out_wd)
+                # Token dicts are built fresh by split_lines_to_tokens above, so fill them in place.
+                wd["bbox_size"] = (int(ww), int(wh))
+                words_out.append(wd)
             
         else:
             # Target page size for normalizing figure sizes (px)
@@ -161,7 +166,7 @@ def generate_json_with_sizes(
             h = max(1, int(round(h0 * scale)))
 
         b2 = dict(b)
-        b2["bbox_size"] = [int(w), int(h)]
+        b2["bbox_size"] = (int(w), int(h))
 
         if b_type != "figure" and b_type != "table":
             b2["words"] = words_out
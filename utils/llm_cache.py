@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Optional
+
+
+# Default lifetime of a cached completion.
+CACHE_TTL_S = 7 * 86400
+
+
+def _cache_db_path() -> Optional[str]:
+    """Return the sqlite file used for caching, or None if caching is disabled.
+
+    Caching is opt-in: set LLM_CACHE_DIR to enable it. Sampling temperatures are > 0 in the
+    generators, so a cache hit trades output diversity for speed (useful for reruns/debugging).
+    """
+    cache_dir = os.environ.get("LLM_CACHE_DIR")
+    if not cache_dir:
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, "completions.sqlite3")
+
+
+# Serializes use of the shared connection: async callers reach it from executor threads.
+_CONN_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=4)
+def _connect(db_path: str) -> sqlite3.Connection:
+    """One connection per process and db path; the schema is created on first use only."""
+    conn = sqlite3.connect(db_path, timeout=30.0, check_same_thread=False)
+    # WAL lets several worker processes read while one writes.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS completions ("
+        "key TEXT PRIMARY KEY, text TEXT NOT NULL, expires_at REAL NOT NULL)"
+    )
+    return conn
+
+
+def cache_key(model: str, system_prompt: str, user_prompt: str, temperature: float) -> str:
+    """SHA-256 over everything that determines the completion."""
+    payload = json.dumps(
+        {
+            "model": model,
+            "system_prompt": system_prompt,
+            "user_prompt": user_prompt,
+            "temperature": temperature,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_get(key: str) -> Optional[str]:
+    """Return the cached completion text for `key`, or None on miss/expiry/disabled cache.
+
+    Blocking (may wait on another process's write lock): async callers should go through
+    asyncio.to_thread.
+    """
+    db_path = _cache_db_path()
+    if db_path is None:
+        return None
+
+    conn = _connect(db_path)
+    with _CONN_LOCK:
+        row = conn.execute(
+            "SELECT text FROM completions WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+    return row[0] if row is not None else None
+
+
+def cache_set(key: str, text: str, ttl_s: float = CACHE_TTL_S) -> None:
+    """Store a completion text under `key` (no-op if caching is disabled)."""
+    db_path = _cache_db_path()
+    if db_path is None:
+        return
+
+    conn = _connect(db_path)
+    with _CONN_LOCK, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO completions (key, text, expires_at) VALUES (?, ?, ?)",
+            (key, text, time.time() + ttl_s),
+        )
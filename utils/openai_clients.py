@@ -0,0 +1,24 @@
+from functools import lru_cache
+
+from openai import AsyncOpenAI, OpenAI
+
+
+# One client per vLLM endpoint for the whole process: every generation module (topic, data, text, code)
+# shares its HTTP keep-alive pool instead of each module opening its own connections.
+
+
+@lru_cache(maxsize=32)
+def get_openai_client(base_url: str) -> OpenAI:
+    return OpenAI(
+        base_url=base_url,
+        api_key="EMPTY",
+    )
+
+
+@lru_cache(maxsize=32)
+def get_async_openai_client(base_url: str) -> AsyncOpenAI:
+    """Async variant; must be used from a single event loop (its connections are bound to it)."""
+    return AsyncOpenAI(
+        base_url=base_url,
+        api_key="EMPTY",
+    )
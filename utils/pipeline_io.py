@@ -0,0 +1,48 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict
+
+import fitz
+
+
+# Write intermediate artifacts (split.json, json_with_bbox_sizes.json) only when debugging.
+PIPELINE_DEBUG = os.environ.get("PIPELINE_DEBUG") == "1"
+
+# One scale matrix per dpi, reused across pages.
+_MATRIX_CACHE: Dict[int, fitz.Matrix] = {}
+
+# PyMuPDF is not thread-safe; concurrent doc runs of one worker reach it from executor threads,
+# so rasterization is serialized per worker process (main.py --workers_per_gpu adds processes).
+_FITZ_LOCK = threading.Lock()
+
+
+def dpi_matrix(dpi: int) -> fitz.Matrix:
+    mat = _MATRIX_CACHE.get(dpi)
+    if mat is None:
+        mat = _MATRIX_CACHE[dpi] = fitz.Matrix(dpi / 72.0, dpi / 72.0)
+    return mat
+
+
+def render_first_page(pdf: str | Path | bytes, dpi: int) -> fitz.Pixmap:
+    """Rasterize page 0 of `pdf` (a path or the PDF bytes) to an RGB pixmap at `dpi`."""
+    with _FITZ_LOCK:
+        if isinstance(pdf, bytes):
+            doc = fitz.open(stream=pdf, filetype="pdf")
+        else:
+            doc = fitz.open(str(pdf))
+        try:
+            page = doc.load_page(0)
+            # Rendered pages carry no annotations; skip that pass and render straight to RGB.
+            return page.get_pixmap(matrix=dpi_matrix(dpi), alpha=False, colorspace=fitz.csRGB, annots=False)
+        finally:
+            doc.close()
+
+
+def write_json(path: str | Path, obj: Any) -> None:
+    """Pretty-print `obj` to `path` as UTF-8 JSON.
+
+    One encode + one write: json.dump() with indent issues a write() per token.
+    """
+    Path(path).write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
@@ -40,13 +40,14 @@ def _bbox_px_to_rect_pt(
 
 
 def render_blocks_json_to_pdf(
-    json_path: str,
+    json_path: Optional[str],
     out_pdf_path: Optional[str],
     draw_frames: bool = False,
     draw_word_bboxes: bool = False,
     style_map: Optional[Dict[str, Dict[str, float]]] = None,
-    picture: io.BytesIO | None = None
-) -> str:
+    picture: io.BytesIO | None = None,
+    data: Optional[Dict] = None,
+) -> str | bytes:
     """
     Reads layout JSON of the form:
     {
@@ -60,12 +61,14 @@ def render_blocks_json_to_pdf(
       - bbox uses TOP-LEFT origin in PIXELS.
       - PDF uses BOTTOM-LEFT origin in POINTS; conversion is handled.
 
-    Returns the output PDF path.
+    Returns the output PDF path, or the PDF bytes if `out_pdf_path` is None (rendered in memory).
     style_map must contain entries for 'title', 'header', 'paragraph' with keys 'font_name', 'font_size', 'leading'.
+    If `data` (the already-parsed layout dict) is given, `json_path` is not read.
     """
 
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    if data is None:
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
 
     page = data["page"]
     page_w_px = float(page["width"])
@@ -75,7 +78,8 @@ def render_blocks_json_to_pdf(
     page_w_pt = _px_to_pt(page_w_px, dpi)
     page_h_pt = _px_to_pt(page_h_px, dpi)
 
-    c = canvas.Canvas(out_pdf_path, pagesize=(page_w_pt, page_h_pt))
+    pdf_buf = io.BytesIO() if out_pdf_path is None else None
+    c = canvas.Canvas(pdf_buf if pdf_buf is not None else out_pdf_path, pagesize=(page_w_pt, page_h_pt))
 
     blocks = data.get("blocks", [])
     blocks_by_id = {b["id"]: b for b in blocks}
@@ -195,4 +199,6 @@ def render_blocks_json_to_pdf(
 
     c.showPage()
     c.save()
+    if pdf_buf is not None:
+        return pdf_buf.getvalue()
     return out_pdf_path
\ No newline at end of file